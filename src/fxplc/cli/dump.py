@@ -0,0 +1,164 @@
+import binascii
+import csv
+import struct
+from dataclasses import dataclass
+from typing import BinaryIO, Iterator, List, TextIO, Tuple
+
+from fxplc.client.FXPLCClient import FXPLCClient, registers_map_bit_images, registers_map_data, \
+    registers_map_special_bit_images, registers_map_special_data, SpecialRegisterStart
+from fxplc.client.models import PlcModel
+
+DumpMagic = b"FXDUMP1\n"
+
+
+@dataclass
+class MemoryArea:
+    name: str
+    register_type: str
+    is_bit_image: bool
+    address: int
+    size: int
+    first_num: int = 0
+
+
+memory_areas: List[MemoryArea] = [
+    MemoryArea("S", "S", True, registers_map_bit_images["S"][0], 1000 // 8),
+    MemoryArea("Y", "Y", True, registers_map_bit_images["Y"][0], 16),
+    MemoryArea("T", "T", True, registers_map_bit_images["T"][0], 256 // 8),
+    MemoryArea("M", "M", True, registers_map_bit_images["M"][0], 1024 // 8),
+    MemoryArea("TV", "T", False, registers_map_data["T"], 256 * 2),
+    MemoryArea("CV", "C", False, registers_map_data["C"], 200 * 2),
+    MemoryArea("D", "D", False, registers_map_data["D"], 512 * 2),
+]
+
+
+def build_memory_areas(model: PlcModel) -> List[MemoryArea]:
+    def bit_image_size(reg_type: str) -> int:
+        denominator = registers_map_bit_images[reg_type][1]
+        return model.ranges[reg_type][1] // denominator + 1
+
+    areas = [
+        MemoryArea("S", "S", True, registers_map_bit_images["S"][0], bit_image_size("S")),
+        MemoryArea("Y", "Y", True, registers_map_bit_images["Y"][0], bit_image_size("Y")),
+        MemoryArea("T", "T", True, registers_map_bit_images["T"][0], bit_image_size("T")),
+        MemoryArea("M", "M", True, registers_map_bit_images["M"][0], bit_image_size("M")),
+        MemoryArea("TV", "T", False, registers_map_data["T"], (model.ranges["T"][1] + 1) * 2),
+        MemoryArea("CV", "C", False, registers_map_data["C"], (model.ranges["C"][1] + 1) * 2),
+        MemoryArea("D", "D", False, registers_map_data["D"], (model.ranges["D"][1] + 1) * 2),
+    ]
+    if "M" in model.extended_ranges:
+        first, last = model.extended_ranges["M"]
+        address = registers_map_special_bit_images["M"] + (first - SpecialRegisterStart) // 8
+        areas.append(MemoryArea("SM", "M", True, address, (last - first) // 8 + 1, first_num=first))
+    if "D" in model.extended_ranges:
+        first, last = model.extended_ranges["D"]
+        address = registers_map_special_data["D"] + (first - SpecialRegisterStart) * 2
+        areas.append(MemoryArea("SD", "D", False, address, (last - first + 1) * 2, first_num=first))
+    return areas
+
+
+def find_areas(names: List[str] | None, model: PlcModel | None = None) -> List[MemoryArea]:
+    available = build_memory_areas(model) if model is not None else memory_areas
+    if names is None:
+        return available
+    areas = []
+    for name in names:
+        matching = [x for x in available if x.name == name.upper()]
+        if len(matching) == 0:
+            raise ValueError(f"unknown memory area: {name}")
+        areas.append(matching[0])
+    return areas
+
+
+def write_dump_block(f: BinaryIO, area: MemoryArea, data: bytes) -> None:
+    name = area.name.encode("ascii")
+    f.write(struct.pack("<B", len(name)) + name + struct.pack("<HH", area.address, len(data)) + data)
+
+
+def read_dump_blocks(f: BinaryIO) -> Iterator[Tuple[str, int, bytes]]:
+    if f.read(len(DumpMagic)) != DumpMagic:
+        raise ValueError("not a fxplc dump file")
+    while True:
+        name_len = f.read(1)
+        if len(name_len) == 0:
+            return
+        name = f.read(name_len[0]).decode("ascii")
+        address, size = struct.unpack("<HH", f.read(4))
+        data = f.read(size)
+        if len(data) != size:
+            raise ValueError("dump file truncated")
+        yield name, address, data
+
+
+def read_dump_csv(f: TextIO) -> Iterator[Tuple[str, int, bytes]]:
+    for row in csv.DictReader(f):
+        yield row["area"], int(row["address"], 16), binascii.unhexlify(row["data"])
+
+
+def load_dump(path: str) -> List[Tuple[str, int, bytes]]:
+    if path.endswith(".csv"):
+        with open(path, "rt", newline="") as ft:
+            return list(read_dump_csv(ft))
+    else:
+        with open(path, "rb") as fb:
+            return list(read_dump_blocks(fb))
+
+
+async def dump_memory(fx: FXPLCClient, path: str, areas: List[MemoryArea]) -> None:
+    if path.endswith(".csv"):
+        with open(path, "wt", newline="") as ft:
+            writer = csv.writer(ft)
+            writer.writerow(["area", "address", "data"])
+            for area in areas:
+                for offset in range(0, area.size, fx.max_bytes_per_frame):
+                    size = min(fx.max_bytes_per_frame, area.size - offset)
+                    data = await fx.read_memory(area.address + offset, size)
+                    writer.writerow([area.name, f"{area.address + offset:04X}", binascii.hexlify(data).decode("ascii")])
+                ft.flush()
+    else:
+        with open(path, "wb") as fb:
+            fb.write(DumpMagic)
+            for area in areas:
+                data = await fx.read_memory(area.address, area.size)
+                write_dump_block(fb, area, data)
+                fb.flush()
+
+
+async def restore_memory(fx: FXPLCClient, path: str, areas: List[MemoryArea]) -> None:
+    area_names = [x.name for x in areas]
+    for name, address, data in load_dump(path):
+        if name in area_names:
+            await fx.write_memory(address, data)
+
+
+def format_difference(area: MemoryArea, offset: int, expected: bytes, actual: bytes) -> List[str]:
+    lines = []
+    if area.is_bit_image:
+        denominator = registers_map_bit_images[area.register_type][1]
+        for bit in range(8):
+            expected_bit, actual_bit = (expected[0] >> bit) & 1, (actual[0] >> bit) & 1
+            if expected_bit != actual_bit:
+                num = area.first_num + offset * denominator + bit
+                lines.append(f"{area.register_type}{num}: {'on' if expected_bit else 'off'} -> "
+                             f"{'on' if actual_bit else 'off'}")
+    else:
+        expected_value, = struct.unpack("<h", expected)
+        actual_value, = struct.unpack("<h", actual)
+        lines.append(f"{area.register_type}{area.first_num + offset // 2}: {expected_value} -> {actual_value}")
+    return lines
+
+
+async def diff_memory(fx: FXPLCClient, path: str, areas: List[MemoryArea]) -> List[str]:
+    differences = []
+    for name, address, data in load_dump(path):
+        matching = [x for x in areas if x.name == name]
+        if len(matching) == 0:
+            continue
+        area = matching[0]
+
+        live = await fx.read_memory(address, len(data))
+        step = 1 if area.is_bit_image else 2
+        for i in range(0, len(data) - step + 1, step):
+            if data[i:i + step] != live[i:i + step]:
+                differences += format_difference(area, address - area.address + i, data[i:i + step], live[i:i + step])
+    return differences
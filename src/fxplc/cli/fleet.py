@@ -0,0 +1,148 @@
+import asyncio
+import csv
+import json
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, TextIO
+
+from fxplc.cli.transport import open_transport
+from fxplc.cli.watch import build_watch_items
+from fxplc.client.FXPLCClient import FXPLCClient
+from fxplc.client.batch import BatchItem, read_items
+from fxplc.client.errors import NoResponseError, ResponseMalformedError, NotSupportedCommandError
+from fxplc.client.models import PlcModel
+from fxplc.client.number_type import NumberType
+from fxplc.transports.TransportTCP import NotConnectedError
+
+# errors after which the PLC is polled again in the next cycle, with a new connection
+PollErrors = (NoResponseError, ResponseMalformedError, NotSupportedCommandError, NotConnectedError, OSError,
+              asyncio.TimeoutError)
+
+
+@dataclass
+class PlcStats:
+    path: str
+    cycles: int = 0
+    errors: int = 0
+    connects: int = 0
+    latencies: List[float] = field(default_factory=list)
+    last_error: str | None = None
+
+
+class FleetOutput:
+    def __init__(self, f: TextIO, fmt: str, items: List[BatchItem]) -> None:
+        self._f = f
+        self._fmt = fmt
+        self._names = [x.name for x in items]
+        self._csv = csv.writer(f) if fmt == "csv" else None
+        if self._csv is not None:
+            self._csv.writerow(["ts", "plc", "cycle", "latency_ms", "error"] + self._names)
+
+    def write(self, path: str, cycle: int, ts: float, latency: float | None,
+              values: Dict[str, int | float | bool] | None, error: str | None) -> None:
+        latency_ms = round(latency * 1000, 1) if latency is not None else None
+        if self._csv is not None:
+            row_values: List[Any] = [values[x] for x in self._names] if values is not None else [""] * len(self._names)
+            self._csv.writerow([f"{ts:.3f}", path, cycle, latency_ms if latency_ms is not None else "",
+                                error or ""] + row_values)
+        else:
+            record: Dict[str, Any] = {"ts": ts, "plc": path, "cycle": cycle, "latency_ms": latency_ms}
+            if error is not None:
+                record["error"] = error
+            else:
+                record["values"] = values
+            self._f.write(json.dumps(record) + "\n")
+        self._f.flush()
+
+
+def read_fleet_file(path: str) -> List[str]:
+    with open(path, "rt") as f:
+        return [x.strip() for x in f if x.strip() != "" and not x.strip().startswith("#")]
+
+
+def format_poll_error(e: Exception) -> str:
+    if isinstance(e, NoResponseError):
+        return "no response"
+    elif isinstance(e, ResponseMalformedError):
+        return "response malformed"
+    elif isinstance(e, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    else:
+        return f"{type(e).__name__}: {e}" if str(e) != "" else type(e).__name__
+
+
+async def poll_plc(path: str, items: List[BatchItem], timeout: float, model: PlcModel | None, interval: float,
+                   cycles: int, output: FleetOutput, stats: PlcStats) -> None:
+    fx: FXPLCClient | None = None
+    try:
+        cycle = 0
+        while cycles == 0 or cycle < cycles:
+            cycle_start = time.monotonic()
+            try:
+                # the connection is kept across cycles and only reopened after an error
+                if fx is None:
+                    stats.connects += 1
+                    fx = FXPLCClient(await asyncio.wait_for(open_transport(path, timeout), timeout * 5), model=model)
+                start = time.monotonic()
+                values = await read_items(fx, items)
+                latency = time.monotonic() - start
+                stats.latencies.append(latency)
+                output.write(path, cycle, time.time(), latency, values, None)
+            except PollErrors as e:
+                stats.errors += 1
+                stats.last_error = format_poll_error(e)
+                output.write(path, cycle, time.time(), None, None, stats.last_error)
+                if fx is not None:
+                    fx.close()
+                    fx = None
+
+            stats.cycles += 1
+            cycle += 1
+            if cycles == 0 or cycle < cycles:
+                await asyncio.sleep(max(0.0, interval - (time.monotonic() - cycle_start)))
+    finally:
+        if fx is not None:
+            fx.close()
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def format_stats(all_stats: List[PlcStats]) -> List[str]:
+    lines = [f"{'plc':<28} {'cycles':>7} {'errors':>7} {'connects':>8} {'p50 ms':>8} {'p90 ms':>8} {'max ms':>8}"
+             f"  last error"]
+    for stats in all_stats:
+        latencies = sorted(stats.latencies)
+        if len(latencies) > 0:
+            lat = f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 90) * 1000:>8.1f} " \
+                  f"{latencies[-1] * 1000:>8.1f}"
+        else:
+            lat = f"{'-':>8} {'-':>8} {'-':>8}"
+        lines.append(f"{stats.path:<28} {stats.cycles:>7} {stats.errors:>7} {stats.connects:>8} {lat}"
+                     f"  {stats.last_error or ''}")
+    return lines
+
+
+async def poll_fleet(paths: List[str], definitions: List[str], timeout: float, model: PlcModel | None,
+                     interval: float, cycles: int, number_type: NumberType, fmt: str, output_path: str | None) -> bool:
+    items = build_watch_items(definitions, number_type, model)
+    # one connection per PLC, a path given twice would fight over the same line
+    all_stats = [PlcStats(path) for path in dict.fromkeys(paths)]
+
+    f = open(output_path, "wt", newline="") if output_path is not None else sys.stdout
+    start = time.monotonic()
+    try:
+        output = FleetOutput(f, fmt, items)
+        await asyncio.gather(*[poll_plc(stats.path, items, timeout, model, interval, cycles, output, stats)
+                               for stats in all_stats])
+    finally:
+        if output_path is not None:
+            f.close()
+        # statistics go to stderr, so they don't mix with the results
+        for line in format_stats(all_stats):
+            print(line, file=sys.stderr)
+        print(f"polled {len(all_stats)} PLCs in {time.monotonic() - start:.1f}s", file=sys.stderr)
+
+    return all(x.errors == 0 for x in all_stats)
@@ -1,22 +1,22 @@
 import argparse
 import asyncio
 import logging
-
+import shlex
+import sys
+from typing import Any, AsyncIterator, List
+
+from fxplc.cli.dump import dump_memory, restore_memory, diff_memory, find_areas
+from fxplc.cli.fleet import poll_fleet, read_fleet_file
+from fxplc.cli.transport import open_transport
+from fxplc.cli.watch import watch
 from fxplc.client.FXPLCClient import FXPLCClient, RegisterDef, RegisterType
-from fxplc.client.errors import NoResponseError, NotSupportedCommandError, ResponseMalformedError
-from fxplc.transports.ITransport import ITransport
-from fxplc.transports.TransportSerial import TransportSerial
-from fxplc.transports.TransportTCP import TransportTCP
-
+from fxplc.client.errors import NoResponseError, NotSupportedCommandError, ResponseMalformedError, \
+    InvalidRegisterError
+from fxplc.client.models import get_plc_model, plc_models
+from fxplc.client.number_type import NumberType
 
-async def main() -> None:
-    argparser = argparse.ArgumentParser()
-    argparser.add_argument('-d', '--debug', action='store_true')
-    argparser.add_argument('-p', '--path', type=str, metavar="PATH", required=True)
-    argparser.add_argument('--timeout', type=int, default=1)
-
-    op_sp = argparser.add_subparsers(title="operation")
 
+def add_operation_parsers(op_sp: Any) -> None:
     sp = op_sp.add_parser('read')
     sp.set_defaults(cmd="read")
     sp.add_argument("register", type=str, nargs='*')
@@ -27,7 +27,7 @@ async def main() -> None:
 
     sp = op_sp.add_parser('read_bytes')
     sp.set_defaults(cmd="read_bytes")
-    sp.add_argument("register")
+    sp.add_argument("register", type=lambda x: int(x, 0), help="byte address, e.g. 0x1000")
     sp.add_argument("count", type=int, default=1, nargs='?')
 
     sp = op_sp.add_parser('read_int')
@@ -44,63 +44,202 @@ async def main() -> None:
     sp.add_argument("register")
     sp.add_argument("value", type=int)
 
+    for name in ("dump", "restore", "diff"):
+        sp = op_sp.add_parser(name)
+        sp.set_defaults(cmd=name)
+        sp.add_argument("file", help="dump file, CSV format is used if the name ends with .csv")
+        sp.add_argument("--areas", type=lambda x: x.split(","), metavar="AREA[,AREA...]",
+                        help="memory areas: S, Y, T, M, TV (timer values), CV (counter values), D, "
+                             "SM/SD (special M/D, with --model) (default: all)")
+
+    sp = op_sp.add_parser('watch')
+    sp.set_defaults(cmd="watch")
+    sp.add_argument("register", type=str, nargs='+', help="register or range, e.g. M0-M63, D100-D120")
+    sp.add_argument("-i", "--interval", type=float, default=0.1, help="polling interval in seconds")
+    sp.add_argument("-t", "--number-type", type=NumberType, default=NumberType.WordSigned,
+                    choices=list(NumberType), metavar="TYPE", help="type of D and C registers")
+    sp.add_argument("-n", "--cycles", type=int, default=None, help="stop after given number of scans")
+    sp.add_argument("--jsonl", action='store_true', help="print changes as JSON lines")
+
+
+async def execute_command(fx: FXPLCClient, args: Any) -> List[str]:
+    output: List[str] = []
+
+    if args.cmd == "read":
+        for r in args.register:
+            reg = RegisterDef.parse(r)
+            bit = await fx.read_bit(r)
+            bit_str = "on" if bit else "off"
+            if reg.type == RegisterType.Timer:
+                cnt = await fx.read_int(r)
+                output.append(f"{reg} = {bit_str}, counter: {cnt}")
+            else:
+                output.append(f"{reg} = {bit_str}")
+
+    if args.cmd == "read_bit":
+        resp_bit = await fx.read_bit(args.register)
+        output.append(str(resp_bit))
+
+    if args.cmd == "write_bit":
+        on = args.value in ("1", "on", "yes", "true")
+        await fx.write_bit(args.register, on)
+
+    if args.cmd == "read_bytes":
+        resp_data = await fx.read_bytes(args.register, args.count)
+        output.append(str(resp_data))
+
+    if args.cmd == "read_int":
+        resp_value = await fx.read_int(args.register)
+        output.append(str(resp_value))
+
+    if args.cmd == "write_int":
+        await fx.write_int(args.register, args.value)
+
+    if args.cmd == "watch":
+        await watch(fx, args.register, args.interval, args.number_type, args.jsonl, args.cycles)
+
+    if args.cmd == "dump":
+        await dump_memory(fx, args.file, find_areas(args.areas, fx.model))
+
+    if args.cmd == "restore":
+        await restore_memory(fx, args.file, find_areas(args.areas, fx.model))
+
+    if args.cmd == "diff":
+        output += await diff_memory(fx, args.file, find_areas(args.areas, fx.model))
+
+    return output
+
+
+def format_error(e: Exception) -> str:
+    if isinstance(e, NotSupportedCommandError):
+        return "[ERROR] Command not supported"
+    elif isinstance(e, NoResponseError):
+        return "[ERROR] No response"
+    elif isinstance(e, ResponseMalformedError):
+        return "[ERROR] Response malformed"
+    elif isinstance(e, (InvalidRegisterError, ValueError, argparse.ArgumentError)):
+        return f"[ERROR] {e}"
+    else:
+        return f"[ERROR] {type(e).__name__}: {e}"
+
+
+async def run_session(fx: FXPLCClient, lines: AsyncIterator[str]) -> bool:
+    session_parser = argparse.ArgumentParser(prog="", add_help=False, exit_on_error=False)
+    add_operation_parsers(session_parser.add_subparsers(title="operation"))
+
+    success = True
+    async for line in lines:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+
+        try:
+            args = session_parser.parse_args(shlex.split(line))
+            if not hasattr(args, "cmd"):
+                raise ValueError("no operation")
+            output = await execute_command(fx, args)
+            print("; ".join(output) if len(output) > 0 else "OK")
+        except SystemExit:
+            print("[ERROR] Invalid command")
+            success = False
+        except Exception as e:
+            # one failing line doesn't end the session, every command gets its result line
+            print(format_error(e))
+            success = False
+        sys.stdout.flush()
+
+    return success
+
+
+async def read_file_lines(path: str) -> AsyncIterator[str]:
+    with open(path, "rt") as f:
+        for line in f:
+            yield line
+
+
+async def read_stdin_lines() -> AsyncIterator[str]:
+    loop = asyncio.get_event_loop()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if len(line) == 0:
+            return
+        yield line
+
+
+async def main() -> None:
+    argparser = argparse.ArgumentParser()
+    argparser.add_argument('-d', '--debug', action='store_true')
+    argparser.add_argument('-p', '--path', type=str, metavar="PATH", help="required by all operations except fleet")
+    argparser.add_argument('--timeout', type=float, default=1)
+    argparser.add_argument('--model', type=str, choices=[x.name for x in plc_models], default=None,
+                           help="PLC model, registers out of its ranges are rejected without a round trip")
+
+    op_sp = argparser.add_subparsers(title="operation")
+    add_operation_parsers(op_sp)
+
+    sp = op_sp.add_parser('shell', help="execute commands read from stdin, one result line per command")
+    sp.set_defaults(cmd="shell")
+
+    sp = op_sp.add_parser('batch', help="execute commands from a script file, one result line per command")
+    sp.set_defaults(cmd="batch")
+    sp.add_argument("file")
+
+    sp = op_sp.add_parser('fleet', help="poll the same registers of many PLCs concurrently")
+    sp.set_defaults(cmd="fleet")
+    sp.add_argument("register", type=str, nargs='+', help="register or range, e.g. M0-M63, D100-D120")
+    sp.add_argument("--plc", type=str, action="append", default=[], metavar="PATH",
+                    help="transport path of a PLC, e.g. tcp:10.0.0.5:8888 or /dev/ttyUSB0, can be repeated")
+    sp.add_argument("--plcs", type=str, metavar="FILE", help="file with one transport path per line")
+    sp.add_argument("-i", "--interval", type=float, default=1, help="polling interval in seconds")
+    sp.add_argument("-n", "--cycles", type=int, default=1, help="number of polls of each PLC, 0 - until interrupted")
+    sp.add_argument("-t", "--number-type", type=NumberType, default=NumberType.WordSigned,
+                    choices=list(NumberType), metavar="TYPE", help="type of D and C registers")
+    sp.add_argument("--format", type=str, choices=["csv", "jsonl"], default="csv")
+    sp.add_argument("-o", "--output", type=str, metavar="FILE", help="write results to a file instead of stdout")
+
     args = argparser.parse_args()
 
     logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO,
                         format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
 
-    transport: ITransport
-    if args.path.startswith("tcp:"):
-        _, host, port = args.path.split(":")
-        tcp_transport = TransportTCP(host, int(port), timeout=args.timeout)
-        await tcp_transport.connect()
-        transport = tcp_transport
-    else:
-        transport = TransportSerial(args.path, timeout=args.timeout)
-    fx = FXPLCClient(transport)
+    model = get_plc_model(args.model) if args.model is not None else None
+
+    if args.cmd == "fleet":
+        paths = args.plc + (read_fleet_file(args.plcs) if args.plcs is not None else [])
+        if len(paths) == 0:
+            argparser.error("fleet requires --plc or --plcs")
+        if not await poll_fleet(paths, args.register, args.timeout, model, args.interval, args.cycles,
+                                args.number_type, args.format, args.output):
+            exit(1)
+        return
+
+    if args.path is None:
+        argparser.error("the following arguments are required: -p/--path")
+
+    fx = FXPLCClient(await open_transport(args.path, args.timeout), model=model)
 
     try:
-        if args.cmd == "read":
-            for r in args.register:
-                reg = RegisterDef.parse(r)
-                bit = await fx.read_bit(r)
-                bit_str = "on" if bit else "off"
-                if reg.type == RegisterType.Timer:
-                    cnt = fx.read_int(r)
-                    print(f"{reg} = {bit_str}, counter: {cnt}")
-                else:
-                    print(f"{reg} = {bit_str}")
-
-        if args.cmd == "read_bit":
-            resp_bit = await fx.read_bit(args.register)
-            print(resp_bit)
-
-        if args.cmd == "write_bit":
-            on = args.value in ("1", "on", "yes", "true")
-            await fx.write_bit(args.register, on)
-
-        if args.cmd == "read_bytes":
-            resp_data = await fx.read_bytes(args.register, args.count)
-            print(resp_data)
-
-        if args.cmd == "read_int":
-            resp_value = await fx.read_int(args.register)
-            print(resp_value)
-
-        if args.cmd == "write_int":
-            await fx.write_int(args.register, args.value)
-    except NotSupportedCommandError:
-        print("[ERROR] Command not supported")
-        exit(1)
-    except NoResponseError:
-        print("[ERROR] No response")
-        exit(1)
-    except ResponseMalformedError:
-        print("[ERROR] Response malformed")
+        if args.cmd == "shell":
+            if not await run_session(fx, read_stdin_lines()):
+                exit(1)
+        elif args.cmd == "batch":
+            if not await run_session(fx, read_file_lines(args.file)):
+                exit(1)
+        else:
+            output = await execute_command(fx, args)
+            for line in output:
+                print(line)
+            if args.cmd == "diff" and len(output) > 0:
+                exit(1)
+    except (NotSupportedCommandError, NoResponseError, ResponseMalformedError, InvalidRegisterError, ValueError) as e:
+        print(format_error(e))
         exit(1)
     finally:
         fx.close()
 
 
 def main_cli() -> None:
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,18 @@
+from fxplc.transports.ITransport import ITransport
+from fxplc.transports.TransportSerial import TransportSerial
+from fxplc.transports.TransportSim import TransportSim
+from fxplc.transports.TransportTCP import TransportTCP
+
+
+async def open_transport(path: str, timeout: float) -> ITransport:
+    if path.startswith("tcp:"):
+        _, host, port = path.split(":")
+        tcp_transport = TransportTCP(host, int(port), timeout=timeout)
+        await tcp_transport.connect()
+        return tcp_transport
+    elif path == "sim" or path.startswith("sim:"):
+        # in-process simulator, sim:BAUDRATE is paced like a serial line
+        _, _, baudrate = path.partition(":")
+        return TransportSim(baudrate=int(baudrate) if baudrate != "" else None, timeout=timeout)
+    else:
+        return TransportSerial(path, timeout=timeout)
@@ -0,0 +1,68 @@
+import asyncio
+import datetime
+import json
+import sys
+import time
+from typing import Dict, List
+
+from fxplc.client.FXPLCClient import FXPLCClient, RegisterType
+from fxplc.client.batch import BatchItem, parse_register_range, read_items
+from fxplc.client.models import PlcModel
+from fxplc.client.number_type import NumberType
+
+StatsInterval = 5
+
+
+def build_watch_items(definitions: List[str], number_type: NumberType,
+                      model: PlcModel | None = None) -> List[BatchItem]:
+    items = []
+    for definition in definitions:
+        for reg in parse_register_range(definition):
+            if model is not None:
+                model.check_register(reg.type.value, reg.num)
+            items.append(BatchItem.for_register(reg, number_type))
+            if reg.type == RegisterType.Timer:
+                items.append(BatchItem.for_number(reg, NumberType.WordSigned, name=f"{reg}.counter"))
+    return items
+
+
+def format_value(value: int | float | bool) -> str:
+    if isinstance(value, bool):
+        return "on" if value else "off"
+    return str(value)
+
+
+async def watch(fx: FXPLCClient, definitions: List[str], interval: float, number_type: NumberType,
+                jsonl: bool, cycles: int | None) -> None:
+    items = build_watch_items(definitions, number_type, fx.model)
+
+    previous: Dict[str, int | float | bool] = {}
+    stats_start = time.monotonic()
+    stats_scans = 0
+    scans = 0
+
+    while cycles is None or scans < cycles:
+        cycle_start = time.monotonic()
+
+        values = await read_items(fx, items)
+        now = datetime.datetime.now()
+        for item in items:
+            value = values[item.name]
+            if item.name in previous and previous[item.name] == value:
+                continue
+            previous[item.name] = value
+            if jsonl:
+                print(json.dumps({"ts": now.timestamp(), "register": item.name, "value": value}))
+            else:
+                print(f"[{now.isoformat(sep=' ', timespec='milliseconds')}] {item.name} = {format_value(value)}")
+        sys.stdout.flush()
+
+        scans += 1
+        stats_scans += 1
+        stats_elapsed = time.monotonic() - stats_start
+        if stats_elapsed >= StatsInterval:
+            print(f"[stats] scan rate: {stats_scans / stats_elapsed:.1f}/s", file=sys.stderr)
+            stats_start = time.monotonic()
+            stats_scans = 0
+
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - cycle_start)))
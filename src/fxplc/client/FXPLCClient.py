@@ -3,9 +3,10 @@ import binascii
 import enum
 import logging
 import struct
-from typing import Tuple, Union, cast
+from typing import Any, Dict, List, Sequence, Tuple, Union, cast
 
 from fxplc.client.errors import ResponseMalformedError, NoResponseError, NotSupportedCommandError
+from fxplc.client.models import PlcModel
 from fxplc.client.number_type import NumberType, register_type_converters
 from fxplc.transports.ITransport import ITransport
 
@@ -22,6 +23,9 @@ CR = b'\x0D'  # Carrier Return
 NAK = b'\x15'  # Not Acknowledge
 
 
+MaxBytesPerFrame = 64
+
+
 class Commands(enum.IntEnum):
     BYTE_READ = 0
     BYTE_WRITE = 1
@@ -52,6 +56,12 @@ registers_map_bits = {
     "M": (0x0800, 8),
 }
 
+# special relays and registers, M8000-M8255 and D8000-D8255
+SpecialRegisterStart = 8000
+registers_map_special_bit_images = {"M": 0x01e0}
+registers_map_special_data = {"D": 0x0e00}
+registers_map_special_bits = {"M": 0x0f00}
+
 
 class RegisterType(enum.Enum):
     State = "S"
@@ -72,31 +82,78 @@ class RegisterDef:
         return f"{self.type.value}{self.num}"
 
     def get_bit_image_address(self) -> Tuple[int, int]:
+        if self.is_special() and self.type.value in registers_map_special_bit_images:
+            num = self.num - SpecialRegisterStart
+            return registers_map_special_bit_images[self.type.value] + num // 8, num % 8
         top_address, denominator = registers_map_bit_images[self.type.value]
         byte_addr, bit = top_address + self.num // denominator, self.num % denominator
         assert bit < 8
         return byte_addr, bit
 
+    def get_bit_address(self) -> int:
+        if self.is_special() and self.type.value in registers_map_special_bits:
+            return registers_map_special_bits[self.type.value] + self.num - SpecialRegisterStart
+        top_address, denominator = registers_map_bits[self.type.value]
+        return top_address + (self.num // denominator * 8 + self.num % denominator)
+
+    def get_data_address(self) -> int:
+        if self.is_special() and self.type.value in registers_map_special_data:
+            return registers_map_special_data[self.type.value] + (self.num - SpecialRegisterStart) * 2
+        return registers_map_data[self.type.value] + self.num * 2
+
+    def is_special(self) -> bool:
+        return self.num >= SpecialRegisterStart
+
     @staticmethod
     def parse(definition: str) -> 'RegisterDef':
         return RegisterDef(reg_type=RegisterType(definition[0]), num=int(definition[1:]))
 
 
+# X follow the inputs and T the timers, so only these bit images are worth writing directly
+BitImageWritableTypes = (RegisterType.State, RegisterType.Output, RegisterType.Memory)
+
+
 def calc_checksum(payload: bytes) -> bytes:
     return bytes(f"{sum(payload):02X}"[-2:].encode("ascii"))
 
 
+def _group_runs(addresses: List[int], max_bytes: int) -> List[Tuple[int, int]]:
+    runs: List[Tuple[int, int]] = []
+    for addr in addresses:
+        if len(runs) > 0 and runs[-1][0] + runs[-1][1] == addr and runs[-1][1] < max_bytes:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((addr, 1))
+    return runs
+
+
 class FXPLCClient:
-    def __init__(self, transport: ITransport):
+    def __init__(self, transport: ITransport, model: PlcModel | None = None):
         self._transport = transport
         self._lock = asyncio.Lock()
+        self._model = model
 
     def close(self) -> None:
         self._transport.close()
 
-    async def read_bit(self, register: Union[RegisterDef, str]) -> bool:
+    @property
+    def model(self) -> PlcModel | None:
+        return self._model
+
+    @property
+    def max_bytes_per_frame(self) -> int:
+        return self._model.max_bytes_per_frame if self._model is not None else MaxBytesPerFrame
+
+    def _resolve(self, register: Union[RegisterDef, str], count: int = 1) -> RegisterDef:
+        # with a known model invalid registers fail here instead of with a timed out round trip
         if not isinstance(register, RegisterDef):
             register = RegisterDef.parse(register)
+        if self._model is not None:
+            self._model.check_register(register.type.value, register.num, count)
+        return register
+
+    async def read_bit(self, register: Union[RegisterDef, str]) -> bool:
+        register = self._resolve(register)
         addr, bit = register.get_bit_image_address()
 
         resp = await self.read_bytes(addr, 1)
@@ -105,24 +162,56 @@ class FXPLCClient:
         return (resp[0] & (1 << bit)) != 0
 
     async def write_bit(self, register: Union[RegisterDef, str], value: bool) -> None:
-        if not isinstance(register, RegisterDef):
-            register = RegisterDef.parse(register)
-        top_address, denominator = registers_map_bits[register.type.value]
-        addr = top_address + (register.num // denominator * 8 + register.num % denominator)
+        register = self._resolve(register)
+        addr = register.get_bit_address()
 
         await self._send_command(Commands.FORCE_ON if value else Commands.FORCE_OFF, struct.pack("<H", addr))
 
+    async def write_bits(self, bits: Sequence[Tuple[Union[RegisterDef, str], bool]],
+                         read_modify_write: bool = False) -> None:
+        """
+        Writes many bits. By default each bit is forced on/off with its own frame.
+
+        With read_modify_write=True, S, Y and M bits are written through their bit images with BYTE_WRITE instead, one
+        frame per run of bytes (plus one read when a byte is only partially written). This is NOT atomic: a bit the PLC
+        program changes between the read and the write in the same byte is overwritten with its old state, and outputs
+        driven by the program are set again on its next scan. Use it only for bits the program doesn't write itself.
+        """
+        bytes_bits: Dict[int, Dict[int, bool]] = {}
+        for register, value in bits:
+            register = self._resolve(register)
+            if read_modify_write and register.type in BitImageWritableTypes:
+                addr, bit = register.get_bit_image_address()
+                bytes_bits.setdefault(addr, {})[bit] = value
+            else:
+                await self.write_bit(register, value)
+
+        for addr, count in _group_runs(sorted(bytes_bits.keys()), self.max_bytes_per_frame):
+            run = [bytes_bits.get(addr + i, {}) for i in range(count)]
+            if all(len(x) == 8 for x in run):
+                data = bytearray(count)
+            else:
+                data = bytearray(await self.read_bytes(addr, count))
+                if len(data) != count:
+                    raise ResponseMalformedError()
+            for i, byte_bits in enumerate(run):
+                for bit, value in byte_bits.items():
+                    if value:
+                        data[i] |= 1 << bit
+                    else:
+                        data[i] &= ~(1 << bit)
+            await self.write_bytes(addr, bytes(data))
+
     async def read_int(self, register: Union[RegisterDef, str]) -> int:
         return cast(int, await self.read_number(register, NumberType.WordSigned))
 
     async def read_number(self, register: Union[RegisterDef, str], number_type: NumberType) -> int | float:
-        if not isinstance(register, RegisterDef):
-            register = RegisterDef.parse(register)
-        addr = registers_map_data[register.type.value] + register.num * 2
-
         number_type_converter = register_type_converters[number_type]
         byte_size = struct.calcsize(number_type_converter.format_str)
 
+        register = self._resolve(register, byte_size // 2)
+        addr = register.get_data_address()
+
         resp = await self.read_bytes(addr, byte_size)
         if len(resp) != byte_size:
             raise ResponseMalformedError()
@@ -130,26 +219,79 @@ class FXPLCClient:
         value: int | float = struct.unpack(number_type_converter.format_str, resp)[0]
         return value
 
+    async def read_array(self, register: Union[RegisterDef, str], count: int,
+                         number_type: NumberType = NumberType.WordSigned) -> List[int | float]:
+        data = await self._read_array_bytes(register, count, number_type)
+        format_str = register_type_converters[number_type].format_str
+        return [x[0] for x in struct.iter_unpack(format_str, data)]
+
+    async def read_ndarray(self, register: Union[RegisterDef, str], count: int,
+                           number_type: NumberType = NumberType.WordSigned) -> Any:
+        import numpy as np
+
+        data = await self._read_array_bytes(register, count, number_type)
+        return np.frombuffer(data, dtype=np.dtype(register_type_converters[number_type].format_str))
+
+    async def _read_array_bytes(self, register: Union[RegisterDef, str], count: int, number_type: NumberType) -> bytes:
+        byte_size = struct.calcsize(register_type_converters[number_type].format_str) * count
+        register = self._resolve(register, byte_size // 2)
+        return await self.read_memory(register.get_data_address(), byte_size)
+
     async def read_bytes(self, addr: int, count: int = 1) -> bytes:
+        if self._model is not None:
+            self._model.check_bytes(count)
         req = struct.pack(">HB", addr, count)
         resp = await self._send_command(Commands.BYTE_READ, req)
         return resp
 
     async def write_bytes(self, addr: int, values: bytes) -> None:
+        if self._model is not None:
+            self._model.check_bytes(len(values))
         req = struct.pack(">HB", addr, len(values)) + values
         await self._send_command(Commands.BYTE_WRITE, req)
 
+    async def read_memory(self, addr: int, count: int) -> bytes:
+        data = b""
+        while len(data) < count:
+            chunk_size = min(self.max_bytes_per_frame, count - len(data))
+            chunk = await self.read_bytes(addr + len(data), chunk_size)
+            if len(chunk) != chunk_size:
+                raise ResponseMalformedError()
+            data += chunk
+        return data
+
+    async def write_memory(self, addr: int, values: bytes) -> None:
+        max_bytes = self.max_bytes_per_frame
+        for offset in range(0, len(values), max_bytes):
+            await self.write_bytes(addr + offset, values[offset:offset + max_bytes])
+
     async def write_int(self, register: Union[RegisterDef, str], value: int) -> None:
         await self.write_number(register, value, NumberType.WordSigned)
 
     async def write_number(self, register: Union[RegisterDef, str], value: int | float, number_type: NumberType) -> None:
-        if not isinstance(register, RegisterDef):
-            register = RegisterDef.parse(register)
-        addr = registers_map_data[register.type.value] + register.num * 2
-
         number_type_converter = register_type_converters[number_type]
+        data = struct.pack(number_type_converter.format_str, value)
 
-        await self.write_bytes(addr, struct.pack(number_type_converter.format_str, value))
+        register = self._resolve(register, len(data) // 2)
+        await self.write_bytes(register.get_data_address(), data)
+
+    async def send_raw_frame(self, frame: bytes) -> bytes:
+        logger.debug(f"TX [raw]: {binascii.hexlify(frame).decode('ascii')}")
+
+        async with self._lock:
+            await self._transport.write(frame)
+            try:
+                return await self._read_raw_response()
+            except TimeoutError:
+                raise NoResponseError()
+
+    async def write_array(self, register: Union[RegisterDef, str], values: Sequence[int | float],
+                          number_type: NumberType = NumberType.WordSigned) -> None:
+        format_str = register_type_converters[number_type].format_str
+        data = struct.pack(f"<{len(values)}{format_str[1:]}", *values)
+
+        register = self._resolve(register, len(data) // 2)
+        await self.write_memory(register.get_data_address(), data)
 
     async def _send_command(self, cmd: int, data: bytes) -> bytes:
         cmd_hex = bytes([ord("0") + cmd])
@@ -206,8 +348,33 @@ class FXPLCClient:
         else:
             raise NoResponseError()
 
+    async def _read_raw_response(self) -> bytes:
+        code = await self._transport.read(1)
+        if code == STX:
+            data = code
+            while True:
+                d = await self._transport.read(1)
+                if len(d) == 0:
+                    raise ResponseMalformedError()
+                data += d
+                if d == ETX:
+                    break
+
+            checksum = await self._transport.read(2)
+            if len(checksum) != 2:
+                raise ResponseMalformedError()
+
+            logger.debug(f"RX [raw]: {binascii.hexlify(data + checksum).decode('ascii')}")
+            return data + checksum
+        elif code in (ACK, NAK):
+            logger.debug(f"RX [raw]: {binascii.hexlify(code).decode('ascii')}")
+            return code
+        else:
+            raise NoResponseError()
+
 
 __all__ = [
+    "MaxBytesPerFrame",
     "RegisterType",
     "RegisterDef",
     "FXPLCClient",
@@ -1,4 +1,4 @@
-from typing import Union
+from typing import List, Sequence, Tuple, Union
 
 from fxplc.client.FXPLCClient import FXPLCClient, RegisterDef
 from fxplc.client.number_type import NumberType
@@ -15,24 +15,45 @@ class FXPLCClientMock(FXPLCClient):
     async def write_bit(self, register: Union[RegisterDef, str], value: bool) -> None:
         pass
 
+    async def write_bits(self, bits: Sequence[Tuple[Union[RegisterDef, str], bool]],
+                         read_modify_write: bool = False) -> None:
+        pass
+
     async def read_int(self, register: Union[RegisterDef, str]) -> int:
         return 0
 
     async def read_number(self, register: Union[RegisterDef, str], number_type: NumberType) -> int | float:
         return 0
 
+    async def read_array(self, register: Union[RegisterDef, str], count: int,
+                         number_type: NumberType = NumberType.WordSigned) -> List[int | float]:
+        return [0] * count
+
     async def read_bytes(self, addr: int, count: int = 1) -> bytes:
-        return b""
+        return bytes(count)
 
     async def write_bytes(self, addr: int, values: bytes) -> None:
         pass
 
+    async def read_memory(self, addr: int, count: int) -> bytes:
+        return bytes(count)
+
+    async def write_memory(self, addr: int, values: bytes) -> None:
+        pass
+
     async def write_int(self, register: Union[RegisterDef, str], value: int) -> None:
         pass
 
     async def write_number(self, register: Union[RegisterDef, str], value: int | float, number_type: NumberType) -> None:
         pass
 
+    async def write_array(self, register: Union[RegisterDef, str], values: Sequence[int | float],
+                          number_type: NumberType = NumberType.WordSigned) -> None:
+        pass
+
+    async def send_raw_frame(self, frame: bytes) -> bytes:
+        return b""
+
 
 __all__ = [
     "FXPLCClientMock",
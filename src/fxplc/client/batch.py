@@ -0,0 +1,150 @@
+import struct
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from fxplc.client.FXPLCClient import FXPLCClient, MaxBytesPerFrame, RegisterDef, RegisterType
+from fxplc.client.errors import ResponseMalformedError
+from fxplc.client.number_type import NumberType, register_type_converters
+
+# Reading a few unused bytes is cheaper than a separate frame (request and response framing plus line turnaround)
+MaxGapBytes = 16
+
+BitRegisterTypes = (RegisterType.State, RegisterType.Input, RegisterType.Output, RegisterType.Timer,
+                    RegisterType.Memory)
+NumberRegisterTypes = (RegisterType.Data, RegisterType.Counter)
+
+# characters are sent as 7E1: start bit, 7 data bits, parity and stop bit
+BitsPerChar = 10
+ReadRequestChars = 11  # STX, command, address (4), count (2), ETX, checksum (2)
+ReadResponseChars = 4  # STX, ETX, checksum (2), plus two hex digits per byte read
+
+
+@dataclass
+class BatchItem:
+    name: str
+    address: int
+    size: int
+    bit: int | None = None
+    number_type: NumberType = NumberType.WordSigned
+
+    @staticmethod
+    def for_bit(register: RegisterDef, name: str | None = None) -> 'BatchItem':
+        addr, bit = register.get_bit_image_address()
+        return BatchItem(name=name or str(register), address=addr, size=1, bit=bit)
+
+    @staticmethod
+    def for_number(register: RegisterDef, number_type: NumberType, name: str | None = None) -> 'BatchItem':
+        addr = register.get_data_address()
+        size = struct.calcsize(register_type_converters[number_type].format_str)
+        return BatchItem(name=name or str(register), address=addr, size=size, number_type=number_type)
+
+    @staticmethod
+    def for_word_bit(register: RegisterDef, bit: int, name: str | None = None) -> 'BatchItem':
+        if register.type not in NumberRegisterTypes or not 0 <= bit < 16:
+            raise ValueError(f"invalid word bit: {register}.{bit}")
+        return BatchItem(name=name or f"{register}.{bit}", address=register.get_data_address(), size=2, bit=bit)
+
+    @staticmethod
+    def parse(definition: str, number_type: NumberType = NumberType.WordSigned, name: str | None = None) -> 'BatchItem':
+        # D10.3 is bit 3 of D10
+        register_str, _, bit_str = definition.partition(".")
+        if bit_str != "":
+            return BatchItem.for_word_bit(RegisterDef.parse(register_str), int(bit_str), name)
+        return BatchItem.for_register(RegisterDef.parse(register_str), number_type, name)
+
+    @staticmethod
+    def for_register(register: RegisterDef, number_type: NumberType = NumberType.WordSigned,
+                     name: str | None = None) -> 'BatchItem':
+        if register.type in BitRegisterTypes:
+            return BatchItem.for_bit(register, name)
+        elif register.type in NumberRegisterTypes:
+            return BatchItem.for_number(register, number_type, name)
+        else:
+            raise ValueError(f"unsupported register: {register}")
+
+    def decode(self, data: bytes) -> int | float | bool:
+        if self.bit is not None:
+            return (int.from_bytes(data, "little") & (1 << self.bit)) != 0
+        value: int | float = struct.unpack(register_type_converters[self.number_type].format_str, data)[0]
+        return value
+
+
+def parse_register_range(definition: str) -> List[RegisterDef]:
+    if "-" not in definition:
+        return [RegisterDef.parse(definition)]
+
+    first_str, last_str = definition.split("-", 1)
+    first = RegisterDef.parse(first_str)
+    last = RegisterDef.parse(last_str) if not last_str.isdigit() else RegisterDef(first.type, int(last_str))
+    if first.type != last.type or last.num < first.num:
+        raise ValueError(f"invalid register range: {definition}")
+
+    return [RegisterDef(first.type, num) for num in range(first.num, last.num + 1) if is_valid_number(first.type, num)]
+
+
+def register_sequence(first: RegisterDef, count: int) -> List[RegisterDef]:
+    registers: List[RegisterDef] = []
+    num = first.num
+    while len(registers) < count:
+        if is_valid_number(first.type, num):
+            registers.append(RegisterDef(first.type, num))
+        num += 1
+    return registers
+
+
+def is_valid_number(reg_type: RegisterType, num: int) -> bool:
+    # X and Y are numbered in octal
+    return reg_type not in (RegisterType.Input, RegisterType.Output) or num % 10 < 8
+
+
+def plan_spans(items: List[BatchItem], max_frame_bytes: int = MaxBytesPerFrame,
+               max_gap: int = MaxGapBytes) -> List[Tuple[int, int]]:
+    spans: List[Tuple[int, int]] = []
+    for item in sorted(items, key=lambda x: x.address):
+        item_end = item.address + item.size
+        if len(spans) > 0:
+            start, end = spans[-1]
+            if item.address <= end + max_gap and max(end, item_end) - start <= max_frame_bytes:
+                spans[-1] = (start, max(end, item_end))
+                continue
+        spans.append((item.address, item_end))
+    return spans
+
+
+def read_wire_time(byte_count: int, baudrate: int) -> float:
+    chars = ReadRequestChars + ReadResponseChars + byte_count * 2
+    return chars * BitsPerChar / baudrate
+
+
+def spans_wire_time(spans: List[Tuple[int, int]], baudrate: int) -> float:
+    return sum(read_wire_time(end - start, baudrate) for start, end in spans)
+
+
+async def read_items(fx: FXPLCClient, items: List[BatchItem],
+                     max_frame_bytes: int | None = None) -> Dict[str, int | float | bool]:
+    memory: Dict[int, bytes] = {}
+    for start, end in plan_spans(items, max_frame_bytes or fx.max_bytes_per_frame):
+        data = await fx.read_bytes(start, end - start)
+        if len(data) != end - start:
+            raise ResponseMalformedError()
+        memory[start] = data
+
+    values: Dict[str, int | float | bool] = {}
+    for item in items:
+        for start, data in memory.items():
+            offset = item.address - start
+            if 0 <= offset and offset + item.size <= len(data):
+                values[item.name] = item.decode(data[offset:offset + item.size])
+                break
+    return values
+
+
+__all__ = [
+    "BatchItem",
+    "parse_register_range",
+    "register_sequence",
+    "plan_spans",
+    "read_wire_time",
+    "spans_wire_time",
+    "read_items",
+]
@@ -10,8 +10,13 @@ class ResponseMalformedError(Exception):
     pass
 
 
+class InvalidRegisterError(Exception):
+    pass
+
+
 __all__ = [
     "NotSupportedCommandError",
     "NoResponseError",
     "ResponseMalformedError",
+    "InvalidRegisterError",
 ]
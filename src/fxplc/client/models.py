@@ -0,0 +1,89 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from fxplc.client.errors import InvalidRegisterError
+
+# Device ranges of each model, as far as the FX-232AW address map reaches them (e.g. M above 1023 isn't mapped).
+# X and Y numbers are octal, written as decimal numbers.
+
+
+@dataclass
+class PlcModel:
+    name: str
+    # register type -> (first, last), inclusive
+    ranges: Dict[str, Tuple[int, int]]
+    # special relays/registers (M8000..., D8000...) mapped outside of the regular areas
+    extended_ranges: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    max_bytes_per_frame: int = 64
+
+    def check_register(self, reg_type: str, num: int, count: int = 1) -> None:
+        valid_number = reg_type not in ("X", "Y") or num % 10 < 8
+        for limits in (self.ranges.get(reg_type), self.extended_ranges.get(reg_type)):
+            if valid_number and limits is not None and limits[0] <= num and num + count - 1 <= limits[1]:
+                return
+        raise InvalidRegisterError(f"{reg_type}{num}" + (f"..{reg_type}{num + count - 1}" if count > 1 else "") +
+                                   f" is out of range for {self.name}")
+
+    def check_bytes(self, count: int) -> None:
+        if count > self.max_bytes_per_frame:
+            raise InvalidRegisterError(f"{count} bytes exceed the {self.name} limit of {self.max_bytes_per_frame} "
+                                       f"bytes per frame")
+
+
+SpecialRanges = {
+    "M": (8000, 8255),
+    "D": (8000, 8255),
+}
+
+plc_models: List[PlcModel] = [
+    PlcModel("FX1S", ranges={
+        "S": (0, 127),
+        "X": (0, 17),
+        "Y": (0, 15),
+        "T": (0, 63),
+        "M": (0, 511),
+        "C": (0, 31),
+        "D": (0, 255),
+    }, extended_ranges=SpecialRanges),
+    PlcModel("FX1N", ranges={
+        "S": (0, 999),
+        "X": (0, 177),
+        "Y": (0, 177),
+        "T": (0, 255),
+        "M": (0, 1023),
+        "C": (0, 199),
+        "D": (0, 7999),
+    }, extended_ranges=SpecialRanges),
+    PlcModel("FX2N", ranges={
+        "S": (0, 999),
+        "X": (0, 267),
+        "Y": (0, 267),
+        "T": (0, 255),
+        "M": (0, 1023),
+        "C": (0, 199),
+        "D": (0, 7999),
+    }, extended_ranges=SpecialRanges),
+    PlcModel("FX3U", ranges={
+        "S": (0, 999),
+        "X": (0, 367),
+        "Y": (0, 367),
+        "T": (0, 255),
+        "M": (0, 1023),
+        "C": (0, 199),
+        "D": (0, 7999),
+    }, extended_ranges=SpecialRanges),
+]
+
+
+def get_plc_model(name: str) -> PlcModel:
+    for model in plc_models:
+        if model.name == name.upper():
+            return model
+    raise ValueError(f"unknown PLC model: {name} (known: {', '.join(x.name for x in plc_models)})")
+
+
+__all__ = [
+    "PlcModel",
+    "plc_models",
+    "get_plc_model",
+]
@@ -1,6 +1,7 @@
 import argparse
 import logging
 
+from fxplc.client.models import plc_models
 from fxplc.http_server.server import run_server
 
 logging.basicConfig(level=logging.INFO, format="[%(asctime)s] [%(name)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S")
@@ -10,8 +11,24 @@ def main() -> None:
     argparser = argparse.ArgumentParser()
     argparser.add_argument("--path", type=str, required=True)
     argparser.add_argument("--variables", type=str, required=False)
+    argparser.add_argument("--baudrate", type=int, default=9600,
+                           help="serial line speed, also used for the scan line budget with TCP transports")
+    argparser.add_argument("--model", type=str, choices=[x.name for x in plc_models], default=None,
+                           help="PLC model, registers out of its ranges are rejected without a round trip")
     argparser.add_argument('--debug', action='store_true')
     argparser.add_argument('--base-href', type=str, default="/")
+    argparser.add_argument('--port', type=int, default=8000)
+    argparser.add_argument('--historian', type=str, metavar="PATH", required=False)
+    argparser.add_argument('--state-file', type=str, metavar="PATH", required=False,
+                           help="persist the last known values, they are served flagged as stale after a restart")
+    argparser.add_argument('--no-ui', action='store_true', help="serve only the REST API, without NiceGUI")
+    argparser.add_argument('--event-webhook', type=str, metavar="URL", required=False,
+                           help="POST condition events as JSON to this http:// URL")
+    argparser.add_argument('--event-socket', type=str, metavar="PATH", required=False,
+                           help="write condition events as JSON lines to this Unix socket")
+    argparser.add_argument('--modbus-port', type=int, required=False, help="enable Modbus TCP gateway on given port")
+    argparser.add_argument('--workers', type=int, default=1,
+                           help="number of HTTP worker processes, the transport is owned by a separate process")
 
     args = argparser.parse_args()
 
@@ -0,0 +1,252 @@
+import asyncio
+import json
+import logging
+import urllib.parse
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Deque, Dict, List, Optional, Tuple, cast
+
+from fastapi import HTTPException
+
+from fxplc.http_server import processor, scanner
+from fxplc.http_server.mytypes import ConditionDefinition, ConditionKind, RuntimeSettings, ScalarValue, \
+    VariableValue
+
+logger = logging.getLogger("fxplc.alarms")
+
+EventLogSize = 1000
+MaxEventWait = 60
+DeliveryQueueSize = 1000
+DeliveryTimeout = 5
+
+EventRaised = "raised"
+EventCleared = "cleared"
+EventTriggered = "triggered"
+
+
+@dataclass
+class Event:
+    id: int
+    timestamp: float
+    condition: str
+    variable: str
+    kind: str
+    state: str
+    # the variable's value, or the rate of change in units per second for rate conditions
+    value: ScalarValue
+
+
+@dataclass
+class ConditionState:
+    active: bool = False
+    last_value: Optional[ScalarValue] = None
+    last_timestamp: float = 0
+
+
+def condition_value(cond: ConditionDefinition, value: VariableValue) -> ScalarValue | None:
+    if isinstance(value, dict):
+        return value.get(cond.field) if cond.field is not None else None
+    return value
+
+
+class AlarmEngine:
+    def __init__(self, runtime_settings: RuntimeSettings) -> None:
+        var_defs = {x.name: x for x in runtime_settings.variables}
+        self._conditions: Dict[str, List[ConditionDefinition]] = {}
+        for cond in runtime_settings.conditions:
+            var_def = var_defs.get(cond.variable)
+            if var_def is None:
+                raise ValueError(f"condition {cond.name}: unknown variable {cond.variable}")
+            if (var_def.fields is not None) != (cond.field is not None) or \
+                    (cond.field is not None and cond.field not in [x.name for x in var_def.fields or []]):
+                raise ValueError(f"condition {cond.name}: a field is required for structures, and only for them")
+            self._conditions.setdefault(cond.variable, []).append(cond)
+
+        self._states: Dict[str, ConditionState] = {x.name: ConditionState() for x in runtime_settings.conditions}
+        self._events: Deque[Event] = deque(maxlen=EventLogSize)
+        self._next_id = 1
+        self._new_events = asyncio.Event()
+        self._delivery_queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=DeliveryQueueSize)
+        self._has_delivery = False
+        self._delivery_task_handle: asyncio.Task[None] | None = None
+
+    def open(self, webhook: str | None = None, socket_path: str | None = None) -> None:
+        # changes come from writes too, scans also report unchanged values, so a rate falls back once they settle
+        scanner.add_listener(self.on_values_changed)
+        scanner.add_scan_listener(self.on_values_changed)
+        if webhook is not None or socket_path is not None:
+            self._has_delivery = True
+            self._delivery_task_handle = asyncio.create_task(self._delivery_task(webhook, socket_path))
+
+    def close(self) -> None:
+        scanner.remove_listener(self.on_values_changed)
+        scanner.remove_scan_listener(self.on_values_changed)
+        if self._delivery_task_handle is not None:
+            self._delivery_task_handle.cancel()
+
+    def evaluate(self, cond: ConditionDefinition, value: ScalarValue,
+                 timestamp: float) -> Tuple[str, ScalarValue] | None:
+        state = self._states[cond.name]
+        last_value, last_timestamp = state.last_value, state.last_timestamp
+        state.last_value, state.last_timestamp = value, timestamp
+
+        if cond.kind in (ConditionKind.Rising, ConditionKind.Falling):
+            # the first value only sets the reference, an edge needs a change seen by the scan
+            if last_value is None or bool(last_value) == bool(value):
+                return None
+            if bool(value) == (cond.kind == ConditionKind.Rising):
+                return EventTriggered, value
+            return None
+
+        if cond.kind == ConditionKind.Rate:
+            if last_value is None or timestamp <= last_timestamp:
+                return None
+            quantity = (value - last_value) / (timestamp - last_timestamp)
+            over, back = abs(quantity) > cond.limit, abs(quantity) <= cond.limit - cond.deadband
+        elif cond.kind == ConditionKind.High:
+            quantity = value
+            over, back = value > cond.limit, value <= cond.limit - cond.deadband
+        else:
+            quantity = value
+            over, back = value < cond.limit, value >= cond.limit + cond.deadband
+
+        if not state.active and over:
+            state.active = True
+            return EventRaised, quantity
+        if state.active and back:
+            state.active = False
+            return EventCleared, quantity
+        return None
+
+    def on_values_changed(self, names: List[str]) -> None:
+        for name in names:
+            conditions = self._conditions.get(name)
+            state = scanner.get_state(name)
+            # restored values are from before the restart, edges against them would be made up
+            if conditions is None or state.error or state.stale or state.value is None:
+                continue
+
+            for cond in conditions:
+                value = condition_value(cond, state.value)
+                if value is None:
+                    continue
+                result = self.evaluate(cond, value, state.timestamp)
+                if result is not None:
+                    self._add_event(cond, result[0], result[1], state.timestamp)
+
+    def _add_event(self, cond: ConditionDefinition, event_state: str, value: ScalarValue, timestamp: float) -> None:
+        event = Event(id=self._next_id, timestamp=timestamp, condition=cond.name, variable=cond.variable,
+                      kind=cond.kind.value, state=event_state, value=value)
+        self._next_id += 1
+        self._events.append(event)
+        logger.info(f"{cond.name} {event_state} ({cond.variable} = {value})")
+
+        # waiters hold the previous event object, so they wake up while new waits block again
+        self._new_events.set()
+        self._new_events = asyncio.Event()
+
+        if self._has_delivery:
+            if self._delivery_queue.full():
+                self._delivery_queue.get_nowait()
+                logger.warning("event delivery queue full, dropping the oldest event")
+            self._delivery_queue.put_nowait(event)
+
+    def query(self, since: int, limit: int) -> List[Dict[str, Any]]:
+        # ids restart with the server, a client ahead of the log gets it from the beginning
+        if since >= self._next_id:
+            since = 0
+        return [asdict(x) for x in self._events if x.id > since][:limit]
+
+    async def wait(self, since: int, limit: int, timeout: float) -> List[Dict[str, Any]]:
+        events = self.query(since, limit)
+        if len(events) > 0 or timeout <= 0:
+            return events
+        try:
+            await asyncio.wait_for(self._new_events.wait(), min(timeout, MaxEventWait))
+        except asyncio.TimeoutError:
+            pass
+        return self.query(since, limit)
+
+    def get_conditions(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "name": cond.name,
+                "variable": cond.variable,
+                "kind": cond.kind.value,
+                "active": self._states[cond.name].active,
+            } for conditions in self._conditions.values() for cond in conditions
+        ]
+
+    async def _delivery_task(self, webhook: str | None, socket_path: str | None) -> None:
+        socket_writer: asyncio.StreamWriter | None = None
+        while True:
+            event = await self._delivery_queue.get()
+            data = json.dumps(asdict(event), separators=(",", ":")).encode("utf-8")
+
+            if webhook is not None:
+                try:
+                    await asyncio.wait_for(post_webhook(webhook, data), DeliveryTimeout)
+                except Exception as e:
+                    logger.warning(f"webhook delivery of event {event.id} failed ({type(e).__name__}) {e}")
+
+            if socket_path is not None:
+                try:
+                    if socket_writer is None:
+                        _, socket_writer = await asyncio.open_unix_connection(socket_path)
+                    socket_writer.write(data + b"\n")
+                    await asyncio.wait_for(socket_writer.drain(), DeliveryTimeout)
+                except Exception as e:
+                    logger.warning(f"socket delivery of event {event.id} failed ({type(e).__name__}) {e}")
+                    if socket_writer is not None:
+                        socket_writer.close()
+                    socket_writer = None
+
+
+async def post_webhook(url: str, data: bytes) -> None:
+    # local receivers only, so plain HTTP without a client library dependency
+    parts = urllib.parse.urlsplit(url)
+    reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+    try:
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode("ascii") + data)
+        await writer.drain()
+        status_line = await reader.readline()
+        status = status_line.split(b" ")
+        if len(status) < 2 or not status[1].startswith(b"2"):
+            raise ConnectionError(f"unexpected response: {status_line.decode('latin-1').strip()}")
+    finally:
+        writer.close()
+
+
+alarm_engine: AlarmEngine | None = None
+
+
+async def get_events(since: int = 0, limit: int = EventLogSize, wait: float = 0) -> List[Dict[str, Any]]:
+    if processor.ipc_client is not None:
+        return cast(List[Dict[str, Any]], await processor.ipc_client.call("events", since=since, limit=limit,
+                                                                          wait=wait))
+    if alarm_engine is None:
+        raise HTTPException(status_code=404, detail="no conditions defined")
+    return await alarm_engine.wait(since, limit, wait)
+
+
+async def get_conditions() -> List[Dict[str, Any]]:
+    if processor.ipc_client is not None:
+        return cast(List[Dict[str, Any]], await processor.ipc_client.call("conditions"))
+    if alarm_engine is None:
+        raise HTTPException(status_code=404, detail="no conditions defined")
+    return alarm_engine.get_conditions()
+
+
+def run_alarm_engine(runtime_settings: RuntimeSettings, webhook: str | None = None,
+                     socket_path: str | None = None) -> None:
+    global alarm_engine
+
+    if alarm_engine is None and len(runtime_settings.conditions) > 0:
+        if webhook is not None and urllib.parse.urlsplit(webhook).scheme != "http":
+            raise ValueError("only http:// webhooks are supported")
+        alarm_engine = AlarmEngine(runtime_settings)
+        alarm_engine.open(webhook, socket_path)
@@ -1,68 +1,68 @@
 import asyncio
-import functools
-import traceback
+import logging
 from asyncio import CancelledError
-from contextlib import closing
 from typing import Any
 
+from fxplc.client.FXPLCClient import STX, ETX, ENQ
 from fxplc.http_server import processor
-from fxplc.http_server.transport import TransportConfig, connect_to_transport
-from fxplc.transports.TransportTCP import NotConnectedError
 
+logger = logging.getLogger("fxplc.aux")
 
-async def handle_aux_client(transport_config: TransportConfig, reader: Any, writer: Any) -> None:
-    print("pause_serial")
-    processor.pause_serial()
+AuxPort = 8889
 
-    try:
-        transport = await connect_to_transport(transport_config)
 
-        with closing(transport):
-            async def tcp_to_transport() -> None:
-                while True:
-                    try:
-                        data = await reader.read(100)
-                        if len(data) == 0:
-                            transport.close()
-                            writer.close()
-                            return
-                        print(f"< {data!r}")
-                        await transport.write(data)
-                    except:
-                        traceback.print_exc()
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    while True:
+        code = await reader.read(1)
+        if len(code) == 0:
+            return None
+
+        if code == ENQ:
+            return code
+        if code == STX:
+            try:
+                body = await reader.readuntil(ETX)
+                checksum = await reader.readexactly(2)
+            except asyncio.IncompleteReadError:
+                return None
+            return code + body + checksum
+
+        logger.debug(f"skipping unexpected byte {code!r}")
+
+
+async def handle_aux_client(reader: asyncio.StreamReader, writer: Any) -> None:
+    peer = writer.get_extra_info("peername")
+    logger.info(f"AUX client connected: {peer}")
+
+    try:
+        while True:
+            frame = await read_frame(reader)
+            if frame is None:
+                break
 
-            async def transport_to_tcp() -> None:
-                while True:
-                    try:
-                        data = await transport.read(100)
-                        if len(data) == 0:
-                            transport.close()
-                            writer.close()
-                            return
-                        print(f"> {data!r}")
-                        writer.write(data)
-                        await writer.drain()
-                    except NotConnectedError:
-                        return
-                    except TimeoutError:
-                        pass
+            # every frame is a separate processor job, so REST requests are interleaved at frame boundaries
+            try:
+                resp = await processor.perform_raw_frame(frame)
+            except Exception as e:
+                logger.warning(f"AUX frame failed ({type(e).__name__}): {e}")
+                continue
 
-            await asyncio.gather(tcp_to_transport(), transport_to_tcp())
-            print("Close the AUX connection")
-            writer.close()
-            await writer.wait_closed()
+            writer.write(resp)
+            await writer.drain()
+    except (ConnectionError, CancelledError):
+        pass
     except:
-        traceback.print_exc()
+        logger.exception("AUX connection error")
     finally:
-        print("resume_serial")
-        processor.resume_serial()
+        logger.info(f"AUX client disconnected: {peer}")
+        writer.close()
 
 
-async def run_aux_server(transport_config: TransportConfig) -> None:
+async def run_aux_server() -> None:
     try:
-        server = await asyncio.start_server(functools.partial(handle_aux_client, transport_config), '0.0.0.0', 8889)
+        server = await asyncio.start_server(handle_aux_client, '0.0.0.0', AuxPort)
         addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
-        print(f"Serving on {addresses}")
+        logger.info(f"AUX serving on {addresses}")
         async with server:
             await server.serve_forever()
     except CancelledError:
@@ -0,0 +1,85 @@
+import enum
+import logging
+import time
+
+logger = logging.getLogger("fxplc.server")
+
+DefaultFailureThreshold = 3
+DefaultResetTimeout = 5
+DefaultRetryRatio = 0.2
+DefaultMaxRetryTokens = 10
+
+
+class BreakerState(enum.Enum):
+    Closed = "closed"
+    Open = "open"
+    HalfOpen = "half-open"
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = DefaultFailureThreshold,
+                 reset_timeout: float = DefaultResetTimeout) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._state = BreakerState.Closed
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> BreakerState:
+        return self._state
+
+    def allow_request(self) -> bool:
+        if self._state == BreakerState.Open:
+            if time.monotonic() - self._opened_at < self._reset_timeout:
+                return False
+            self._set_state(BreakerState.HalfOpen)
+            self._probe_in_flight = False
+
+        if self._state == BreakerState.HalfOpen:
+            # only a single probe is let through, everything else fails fast until it completes
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+
+        return True
+
+    def release_probe(self) -> None:
+        # the admitted request never told anything about the link, the next one may probe
+        self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        self._failures = 0
+        self._probe_in_flight = False
+        if self._state != BreakerState.Closed:
+            self._set_state(BreakerState.Closed)
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._probe_in_flight = False
+        if self._state == BreakerState.HalfOpen or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            if self._state != BreakerState.Open:
+                self._set_state(BreakerState.Open)
+
+    def _set_state(self, state: BreakerState) -> None:
+        logger.info(f"circuit breaker: {self._state.value} -> {state.value}")
+        self._state = state
+
+
+# every request deposits a fraction of a retry token, every retry withdraws a whole one
+class RetryBudget:
+    def __init__(self, ratio: float = DefaultRetryRatio, max_tokens: float = DefaultMaxRetryTokens) -> None:
+        self._ratio = ratio
+        self._max_tokens = max_tokens
+        self._tokens = max_tokens
+
+    def deposit(self) -> None:
+        self._tokens = min(self._max_tokens, self._tokens + self._ratio)
+
+    def withdraw(self) -> bool:
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
@@ -0,0 +1,92 @@
+import contextvars
+import json
+from dataclasses import dataclass
+from typing import Any, Tuple
+
+from fastapi import Request
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+try:
+    import msgpack
+
+    HAS_MSGPACK = True
+except ImportError:
+    HAS_MSGPACK = False
+
+try:
+    import cbor2
+
+    HAS_CBOR = True
+except ImportError:
+    HAS_CBOR = False
+
+MediaTypeJson = "application/json"
+MediaTypeMsgpack = "application/msgpack"
+MediaTypeCbor = "application/cbor"
+
+MsgpackMediaTypes = (MediaTypeMsgpack, "application/x-msgpack", "application/vnd.msgpack")
+
+
+@dataclass
+class ResponseFormat:
+    media_type: str = MediaTypeJson
+    pretty: bool = False
+
+
+response_format: contextvars.ContextVar[ResponseFormat] = contextvars.ContextVar("response_format",
+                                                                                  default=ResponseFormat())
+
+
+def negotiate_format(accept: str | None, pretty: bool) -> ResponseFormat:
+    # the binary formats are only offered when their packages are installed, otherwise JSON is the fallback
+    for part in (accept or "").split(","):
+        media_type = part.split(";")[0].strip().lower()
+        if media_type in MsgpackMediaTypes and HAS_MSGPACK:
+            return ResponseFormat(MediaTypeMsgpack)
+        elif media_type == MediaTypeCbor and HAS_CBOR:
+            return ResponseFormat(MediaTypeCbor)
+        elif media_type in (MediaTypeJson, "application/*", "*/*"):
+            break
+    return ResponseFormat(MediaTypeJson, pretty)
+
+
+async def negotiate_response_format(request: Request) -> None:
+    pretty = request.query_params.get("pretty", "0").lower() in ("1", "true", "yes")
+    response_format.set(negotiate_format(request.headers.get("accept"), pretty))
+
+
+def encode_content(content: Any, fmt: ResponseFormat) -> bytes:
+    if fmt.media_type == MediaTypeMsgpack:
+        data: bytes = msgpack.packb(content)
+        return data
+    elif fmt.media_type == MediaTypeCbor:
+        data = cbor2.dumps(content)
+        return data
+    elif fmt.pretty:
+        return json.dumps(content, indent=2, sort_keys=True).encode("utf-8")
+    elif HAS_ORJSON:
+        return orjson.dumps(content)
+    else:
+        return json.dumps(content, separators=(",", ":")).encode("utf-8")
+
+
+class CompressionMiddleware:
+    # GZipMiddleware doesn't flush its compressor between chunks, so streamed responses would sit in its buffer
+    def __init__(self, app: ASGIApp, minimum_size: int, uncompressed_paths: Tuple[str, ...] = ()) -> None:
+        self._app = app
+        self._gzip = GZipMiddleware(app, minimum_size=minimum_size)
+        self._uncompressed_paths = uncompressed_paths
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].endswith(self._uncompressed_paths):
+            await self._app(scope, receive, send)
+        else:
+            await self._gzip(scope, receive, send)
@@ -4,3 +4,7 @@ class RequestException(Exception):
 
 class RequestTimeoutException(Exception):
     pass
+
+
+class CircuitOpenException(Exception):
+    pass
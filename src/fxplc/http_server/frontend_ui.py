@@ -1,15 +1,16 @@
 import functools
-from typing import Any
+from typing import Any, Callable, Dict, List, Optional, cast
 import urllib.parse
 
 from nicegui import ui, Client
-from nicegui.functions.refreshable import refreshable
 
 from fxplc.client.FXPLCClient import RegisterDef, RegisterType
+from fxplc.http_server import scanner
 from fxplc.http_server.js_helpers import add_custom_json, js_copy_handler
 from fxplc.http_server.mytypes import VariableDefinition, RuntimeSettings
-from fxplc.http_server.processor import perform_register_read, perform_register_write, resume_serial, \
-    pause_serial, is_running, perform_register_write_bit
+from fxplc.http_server.processor import resume_serial, pause_serial, is_running
+from fxplc.http_server.scanner import VariableState
+from fxplc.http_server.variables import split_register, write_variable
 
 
 def set_running(running: bool) -> None:
@@ -32,7 +33,6 @@ def register_ui(runtime_settings: RuntimeSettings) -> None:
         url = await ui.run_javascript('window.location.href')
 
         notification_timeout = 1000
-        only_placeholder = True
 
         def append_context_menu(el, var_def):
             with el:
@@ -42,88 +42,102 @@ def register_ui(runtime_settings: RuntimeSettings) -> None:
                     ui.menu_item(f'Copy GET URL') \
                         .on('click', js_handler=js_copy_handler(urllib.parse.urljoin(url, f"variable/{var_def.name}")))
 
-        @refreshable  # type: ignore
-        async def ui_vars() -> None:
-            nonlocal only_placeholder
-            if only_placeholder:
-                only_placeholder = False
-                return
-
-            spinner_el = ui.spinner(size='lg')
-
-            def_to_val = {}
-            try:
-                for var_def in runtime_settings.variables:
-                    val = await perform_register_read(var_def.register, var_def.number_type)
-                    def_to_val[var_def.name] = val
-            except:
-                ui.notify(f"Unable to update fetch data", type="negative", timeout=notification_timeout)
-                return
-            finally:
-                spinner_el.delete()
-
-            def emit_control(var_def: VariableDefinition) -> None:
-                val = def_to_val[var_def.name]
-
-                reg = RegisterDef.parse(var_def.register)
-
-                if reg.type in (RegisterType.Input,):
-                    u = ui.switch(text=var_def.name, value=bool(val))
-                    u.disable()
+        updaters: Dict[str, Callable[[VariableState], None]] = {}
+
+        def update_switch(u_: Any, state_: VariableState) -> None:
+            u_.value = bool(state_.value)
+
+        def emit_control(var_def: VariableDefinition) -> None:
+            state = scanner.get_state(var_def.name)
+
+            register_str, bit = split_register(var_def.register)
+            reg = RegisterDef.parse(register_str)
+
+            if var_def.fields is not None:
+                def update_label(u_: Any, state_: VariableState) -> None:
+                    u_.text = f"{var_def.name}: {state_.value}"
+
+                label = ui.label(text=f"{var_def.name}: {state.value}")
+                append_context_menu(label, var_def)
+                updaters[var_def.name] = functools.partial(update_label, label)
+            elif reg.type in (RegisterType.Input,):
+                u = ui.switch(text=var_def.name, value=bool(state.value))
+                u.disable()
+                append_context_menu(u, var_def)
+
+                updaters[var_def.name] = functools.partial(update_switch, u)
+            elif reg.type in (RegisterType.Output, RegisterType.Memory,) or bit is not None:
+                async def fn1(var_def_: VariableDefinition, e: Any) -> None:
+                    was_enabled = e.value
+                    # change caused by the value feed, not by the operator
+                    if was_enabled == bool(scanner.get_state(var_def_.name).value):
+                        return
+                    action_str = "enabled" if was_enabled else "disabled"
+                    try:
+                        await write_variable(var_def_, was_enabled)
+                        scanner.publish_value(var_def_.name, was_enabled)
+                        ui.notify(f"{var_def_.name} {action_str}", type="positive", timeout=notification_timeout)
+                    except:
+                        e.sender.value = bool(scanner.get_state(var_def_.name).value)
+                        ui.notify(f"Unable to update {var_def_.name} status", type="negative",
+                                  timeout=notification_timeout)
+
+                with ui.row():
+                    u = ui.switch(text=var_def.name, value=bool(state.value), on_change=functools.partial(fn1, var_def))
+                    if var_def.readonly:
+                        u.disable()
                     append_context_menu(u, var_def)
-                if reg.type in (RegisterType.Output, RegisterType.Memory,):
-                    async def fn1(var_def_: VariableDefinition, e: Any) -> None:
-                        was_enabled = e.value
-                        action_str = "enabled" if was_enabled else "disabled"
-                        try:
-                            await perform_register_write_bit(var_def_.register, was_enabled)
-                            ui.notify(f"{var_def_.name} {action_str}", type="positive", timeout=notification_timeout)
-                        except:
-                            ui.notify(f"Unable to update {var_def_.name} status", type="negative",
-                                      timeout=notification_timeout)
-
-                    with ui.row():
-                        u = ui.switch(text=var_def.name, value=bool(val), on_change=functools.partial(fn1, var_def))
-                        if var_def.readonly:
-                            u.disable()
-                        append_context_menu(u, var_def)
-                if reg.type in (RegisterType.Data, RegisterType.Counter):
-                    async def fn2(ui_value_el_: Any, var_def_: VariableDefinition) -> None:
-                        try:
-                            await perform_register_write(var_def_.register, ui_value_el_.value, var_def_.number_type)
-                            ui.notify(f"{var_def_.name} set to {ui_value_el_.value}", type="positive",
-                                      timeout=notification_timeout)
-                        except:
-                            ui.notify(f"Unable to update {var_def_.name} value", type="negative",
-                                      timeout=notification_timeout)
-
-                    with ui.row() as r:
-                        r.style("align-items: center;")
-                        ui_value_el = ui.number(label=var_def.name, value=int(val), on_change=None) \
-                            .style("width: 300px")
-                        append_context_menu(ui_value_el, var_def)
-                        if var_def.readonly:
-                            ui_value_el.disable()
-                        else:
-                            ui.button(text="Set", on_click=functools.partial(fn2, ui_value_el, var_def))
-
-            groups = list(dict.fromkeys([x.group for x in runtime_settings.variables]))
-
-            with ui.row():
-                for group in groups:
-                    with ui.card():
-                        ui.label(text=group).style("font-size: 18px; font-weight: bold")
-                        for var_def in (x for x in runtime_settings.variables if x.group == group):
-                            emit_control(var_def)
+                updaters[var_def.name] = functools.partial(update_switch, u)
+            elif reg.type in (RegisterType.Data, RegisterType.Counter):
+                async def fn2(ui_value_el_: Any, var_def_: VariableDefinition) -> None:
+                    try:
+                        scanner.publish_value(var_def_.name, await write_variable(var_def_, ui_value_el_.value))
+                        ui.notify(f"{var_def_.name} set to {ui_value_el_.value}", type="positive",
+                                  timeout=notification_timeout)
+                    except:
+                        ui.notify(f"Unable to update {var_def_.name} value", type="negative",
+                                  timeout=notification_timeout)
+
+                def update_number(ui_value_el_: Any, shown: Dict[str, Any], state_: VariableState) -> None:
+                    # don't overwrite a value the operator is in the middle of editing
+                    if ui_value_el_.value == shown["value"]:
+                        ui_value_el_.value = state_.value
+                    shown["value"] = state_.value
+
+                with ui.row() as r:
+                    r.style("align-items: center;")
+                    ui_value_el = ui.number(label=var_def.name, value=cast(Optional[float], state.value),
+                                            suffix=var_def.units, on_change=None) \
+                        .style("width: 300px")
+                    append_context_menu(ui_value_el, var_def)
+                    if var_def.readonly:
+                        ui_value_el.disable()
+                    else:
+                        ui.button(text="Set", on_click=functools.partial(fn2, ui_value_el, var_def))
+                updaters[var_def.name] = functools.partial(update_number, ui_value_el, {"value": state.value})
+
+        def on_values_changed(names: List[str]) -> None:
+            for name in names:
+                updater = updaters.get(name)
+                if updater is not None:
+                    updater(scanner.get_state(name))
 
         with ui.row():
             ui.switch(text="Running",
                       value=is_running(),
                       on_change=lambda x: set_running(x.value)).props("color=red")
-            ui.button(text="Refresh variables", on_click=ui_vars.refresh)
             ui.switch(text="REST enabled",
                       value=runtime_settings.rest_enabled,
                       on_change=lambda x: set_rest_enabled(runtime_settings, x.value)).props("color=green")
 
-        await ui_vars()
-        ui_vars.refresh()
+        groups = list(dict.fromkeys([x.group for x in runtime_settings.variables]))
+
+        with ui.row():
+            for group in groups:
+                with ui.card():
+                    ui.label(text=group).style("font-size: 18px; font-weight: bold")
+                    for var_def in (x for x in runtime_settings.variables if x.group == group):
+                        emit_control(var_def)
+
+        scanner.add_listener(on_values_changed)
+        client.on_disconnect(lambda: scanner.remove_listener(on_values_changed))
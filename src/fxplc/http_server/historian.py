@@ -0,0 +1,257 @@
+import importlib.util
+import logging
+import os
+import struct
+import time
+from collections import deque
+from typing import Any, BinaryIO, Deque, Dict, List, Optional, Tuple, cast
+
+from fastapi import HTTPException
+
+from fxplc.http_server import processor, scanner
+from fxplc.http_server.mytypes import RuntimeSettings, VariableDefinition
+
+# NumPy is imported by the first aggregated query only, servers that never run one don't pay for it
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+logger = logging.getLogger("fxplc.historian")
+
+HistorySize = 10000
+HeartbeatInterval = 600
+# the file is rewritten from the ring buffers once it grows past this
+HistoryFileSize = 16 * 1024 * 1024
+
+# File records:
+#   T <f64 timestamp>                    - sets the time cursor
+#   N <varint id> <varint len> <name>    - defines a variable id
+#   V <varint id> <varint dt_ms> <f64>   - sample, dt_ms is relative to the time cursor, which then advances
+RecordTime = b"T"
+RecordName = b"N"
+RecordValue = b"V"
+
+Sample = Tuple[float, float]
+
+
+def encode_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        if pos >= len(data):
+            raise IndexError()
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, pos
+
+
+class Historian:
+    def __init__(self, runtime_settings: RuntimeSettings, path: str, history_size: int = HistorySize) -> None:
+        self._var_defs: Dict[str, VariableDefinition] = {x.name: x for x in runtime_settings.variables}
+        self._path = path
+        self._buffers: Dict[str, Deque[Sample]] = {x.name: deque(maxlen=history_size) for x in runtime_settings.variables}
+        self._ids: Dict[str, int] = {}
+        self._cursor = 0.0
+        self._file: Optional[BinaryIO] = None
+        self._compact_at = HistoryFileSize
+
+    def open(self) -> None:
+        if os.path.exists(self._path):
+            self._load()
+        self._compact()
+
+        # scans report unchanged values too, they are recorded once per heartbeat interval
+        scanner.add_listener(self.on_values_changed)
+        scanner.add_scan_listener(self.on_values_changed)
+
+    def close(self) -> None:
+        scanner.remove_listener(self.on_values_changed)
+        scanner.remove_scan_listener(self.on_values_changed)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _compact(self) -> None:
+        # the samples older than the ring buffers are dropped, so the file never holds more than they do
+        if self._file is not None:
+            self._file.close()
+
+        samples = sorted((t, name, v) for name, buffer in self._buffers.items() for t, v in buffer)
+        self._ids = {}
+        self._cursor = samples[0][0] if len(samples) > 0 else time.time()
+        out = bytearray(RecordTime + struct.pack("<d", self._cursor))
+        for t, name, v in samples:
+            out += self._encode_sample(name, t, v)
+
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(out)
+        os.replace(tmp_path, self._path)
+
+        self._file = open(self._path, "ab")
+        # a file that is mostly live data isn't rewritten again right away
+        self._compact_at = max(HistoryFileSize, 2 * len(out))
+
+    def _load(self) -> None:
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        names: Dict[int, str] = {}
+        cursor = 0.0
+        pos = 0
+        try:
+            while pos < len(data):
+                record = data[pos:pos + 1]
+                pos += 1
+                if record == RecordTime:
+                    cursor, = struct.unpack_from("<d", data, pos)
+                    pos += 8
+                elif record == RecordName:
+                    var_id, pos = decode_varint(data, pos)
+                    length, pos = decode_varint(data, pos)
+                    names[var_id] = data[pos:pos + length].decode("utf-8")
+                    pos += length
+                elif record == RecordValue:
+                    var_id, pos = decode_varint(data, pos)
+                    dt_ms, pos = decode_varint(data, pos)
+                    value, = struct.unpack_from("<d", data, pos)
+                    pos += 8
+                    cursor += dt_ms / 1000
+                    buffer = self._buffers.get(names.get(var_id, ""))
+                    if buffer is not None:
+                        buffer.append((cursor, value))
+                else:
+                    logger.warning(f"history file corrupted at offset {pos - 1}, ignoring the rest")
+                    break
+        except (IndexError, struct.error):
+            # a record cut by a crash or power loss
+            logger.warning("history file ends with a truncated record")
+
+        logger.info(f"loaded history from {self._path}")
+
+    def _encode_sample(self, name: str, timestamp: float, value: float) -> bytes:
+        out = b""
+        var_id = self._ids.get(name)
+        if var_id is None:
+            var_id = self._ids[name] = len(self._ids)
+            name_bytes = name.encode("utf-8")
+            out += RecordName + encode_varint(var_id) + encode_varint(len(name_bytes)) + name_bytes
+
+        dt_ms = max(0, round((timestamp - self._cursor) * 1000))
+        self._cursor += dt_ms / 1000
+        return out + RecordValue + encode_varint(var_id) + encode_varint(dt_ms) + struct.pack("<d", value)
+
+    def on_values_changed(self, names: List[str]) -> None:
+        out = b""
+        for name in names:
+            var_def = self._var_defs.get(name)
+            state = scanner.get_state(name)
+            # structures aren't recorded, only scalar variables
+            if var_def is None or state.error or state.value is None or isinstance(state.value, dict):
+                continue
+
+            value = float(state.value)
+            buffer = self._buffers[name]
+            if len(buffer) > 0:
+                last_ts, last_value = buffer[-1]
+                if abs(value - last_value) <= var_def.deadband and state.timestamp - last_ts < HeartbeatInterval:
+                    continue
+
+            buffer.append((state.timestamp, value))
+            out += self._encode_sample(name, state.timestamp, value)
+
+        if len(out) > 0 and self._file is not None:
+            self._file.write(out)
+            self._file.flush()
+            if self._file.tell() >= self._compact_at:
+                self._compact()
+
+    def query(self, name: str, start: float, end: float, buckets: Optional[int] = None) -> List[Dict[str, Any]]:
+        samples = [x for x in self._buffers[name] if start <= x[0] <= end]
+
+        if buckets is None:
+            return [{"t": t, "value": v} for t, v in samples]
+
+        if len(samples) == 0 or buckets <= 0 or end <= start:
+            return []
+
+        if HAS_NUMPY:
+            return downsample_numpy(samples, start, end, buckets)
+        else:
+            return downsample_python(samples, start, end, buckets)
+
+
+def downsample_numpy(samples: List[Sample], start: float, end: float, buckets: int) -> List[Dict[str, Any]]:
+    import numpy as np
+
+    data = np.array(samples, dtype=np.float64)
+    ts, values = data[:, 0], data[:, 1]
+
+    idx = np.clip(((ts - start) * buckets / (end - start)).astype(np.int64), 0, buckets - 1)
+    counts = np.bincount(idx, minlength=buckets)
+    sums = np.bincount(idx, weights=values, minlength=buckets)
+    mins = np.full(buckets, np.inf)
+    np.minimum.at(mins, idx, values)
+    maxs = np.full(buckets, -np.inf)
+    np.maximum.at(maxs, idx, values)
+
+    bucket_width = (end - start) / buckets
+    return [{
+        "t": float(start + i * bucket_width),
+        "min": float(mins[i]),
+        "max": float(maxs[i]),
+        "avg": float(sums[i] / counts[i]),
+        "count": int(counts[i]),
+    } for i in np.nonzero(counts)[0]]
+
+
+def downsample_python(samples: List[Sample], start: float, end: float, buckets: int) -> List[Dict[str, Any]]:
+    bucket_width = (end - start) / buckets
+    result: Dict[int, Dict[str, Any]] = {}
+    for t, v in samples:
+        i = min(int((t - start) / bucket_width), buckets - 1)
+        bucket = result.get(i)
+        if bucket is None:
+            result[i] = {"t": start + i * bucket_width, "min": v, "max": v, "avg": v, "count": 1}
+        else:
+            bucket["min"] = min(bucket["min"], v)
+            bucket["max"] = max(bucket["max"], v)
+            bucket["avg"] += v
+            bucket["count"] += 1
+
+    for bucket in result.values():
+        bucket["avg"] /= bucket["count"]
+    return [result[i] for i in sorted(result)]
+
+
+historian: Historian | None = None
+
+
+async def get_history(name: str, start: float, end: float, buckets: Optional[int] = None) -> List[Dict[str, Any]]:
+    if processor.ipc_client is not None:
+        return cast(List[Dict[str, Any]], await processor.ipc_client.call("history", name=name, start=start, end=end,
+                                                                          buckets=buckets))
+    if historian is None:
+        raise HTTPException(status_code=404, detail="historian disabled")
+    return historian.query(name, start, end, buckets)
+
+
+def run_historian(runtime_settings: RuntimeSettings, path: str) -> None:
+    global historian
+
+    if historian is None:
+        historian = Historian(runtime_settings, path)
+        historian.open()
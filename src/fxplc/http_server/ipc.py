@@ -0,0 +1,71 @@
+import asyncio
+import json
+import logging
+from typing import Any, Dict
+
+from fastapi import HTTPException
+
+logger = logging.getLogger("fxplc.ipc")
+
+# Messages are JSON lines:
+#   request:  {"id": 1, "op": "read", "args": {...}}
+#   response: {"id": 1, "result": ...} or {"id": 1, "error": {"status_code": 400, "detail": "..."}}
+
+
+def encode_message(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(",", ":")).encode("utf-8") + b"\n"
+
+
+class IpcClient:
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._writer: asyncio.StreamWriter | None = None
+        self._reader_task: asyncio.Task[None] | None = None
+        self._pending: Dict[int, asyncio.Future[Any]] = {}
+        self._next_id = 0
+        self._connect_lock = asyncio.Lock()
+
+    async def call(self, op: str, **kwargs: Any) -> Any:
+        writer = await self._get_writer()
+
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            writer.write(encode_message({"id": request_id, "op": op, "args": kwargs}))
+            await writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def _get_writer(self) -> asyncio.StreamWriter:
+        async with self._connect_lock:
+            if self._writer is None:
+                try:
+                    reader, self._writer = await asyncio.open_unix_connection(self._path)
+                except OSError:
+                    raise HTTPException(status_code=503, detail="serial owner process unavailable")
+                self._reader_task = asyncio.create_task(self._read_responses(reader))
+            return self._writer
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                message = json.loads(line)
+                future = self._pending.get(message["id"])
+                if future is None or future.done():
+                    continue
+                if "error" in message:
+                    future.set_exception(HTTPException(**message["error"]))
+                else:
+                    future.set_result(message["result"])
+        finally:
+            logger.warning("connection to the serial owner process lost")
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(HTTPException(status_code=503, detail="serial owner process unavailable"))
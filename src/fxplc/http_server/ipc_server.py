@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import os
+from asyncio import CancelledError
+from typing import Any, Awaitable, Callable, Dict, List, Set
+
+from fastapi import HTTPException
+
+from fxplc.client.number_type import NumberType
+from fxplc.http_server import scanner
+from fxplc.http_server.alarms import get_conditions, get_events
+from fxplc.http_server.historian import get_history
+from fxplc.http_server.ipc import encode_message
+from fxplc.http_server.processor import perform_register_read, perform_register_write, perform_register_read_bit, \
+    perform_register_write_bit, perform_set_running, perform_batch_read, perform_word_bit_write, perform_register_add, \
+    perform_word_mask, perform_compare_and_set, perform_register_toggle_bit
+
+logger = logging.getLogger("fxplc.ipc")
+
+
+operations: Dict[str, Callable[..., Awaitable[Any]]] = {
+    "read": lambda register, number_type: perform_register_read(register, NumberType(number_type)),
+    "write": lambda register, value, number_type: perform_register_write(register, value, NumberType(number_type)),
+    "read_bit": lambda register: perform_register_read_bit(register),
+    "write_bit": lambda register, value: perform_register_write_bit(register, value),
+    "set_running": lambda running: perform_set_running(running),
+    "write_word_bit": lambda register, bit, value: perform_word_bit_write(register, bit, value),
+    "toggle_bit": lambda register: perform_register_toggle_bit(register),
+    "add": lambda register, delta, number_type: perform_register_add(register, delta, NumberType(number_type)),
+    "mask": lambda register, set_mask, clear_mask, toggle_mask: perform_word_mask(register, set_mask, clear_mask,
+                                                                                  toggle_mask),
+    "compare_and_set": lambda register, expected, value, number_type: perform_compare_and_set(
+        register, expected, value, NumberType(number_type)),
+    "read_batch": lambda registers: perform_batch_read([(register, NumberType(number_type))
+                                                        for register, number_type in registers]),
+    "events": lambda since, limit, wait: get_events(since, limit, wait),
+    "conditions": lambda: get_conditions(),
+    "history": lambda name, start, end, buckets: get_history(name, start, end, buckets),
+    "scan_stats": lambda: scanner.get_scan_stats(),
+}
+
+
+class ValueFeed:
+    # pushes every change of the variable states to an HTTP worker
+    def __init__(self, writer: asyncio.StreamWriter) -> None:
+        self._writer = writer
+        self._active = False
+        scanner.feed_listeners.append(self.on_values_changed)
+        self.on_values_changed(list(scanner.variable_states))
+
+    def handle(self, op: str, args: Dict[str, Any]) -> None:
+        if op == "watch":
+            self.set_active(args["active"])
+        elif op == "publish":
+            scanner.publish_value(args["name"], args["value"])
+
+    def set_active(self, active: bool) -> None:
+        # the owner scans while the worker has listeners, as it would for its own
+        if active != self._active:
+            self._active = active
+            scanner.remote_watchers += 1 if active else -1
+
+    def on_values_changed(self, names: List[str]) -> None:
+        self._writer.write(encode_message({"push": "values", "instance": scanner.instance_id,
+                                           "states": scanner.encode_states(names)}))
+
+    def close(self) -> None:
+        self.set_active(False)
+        scanner.feed_listeners.remove(self.on_values_changed)
+
+
+async def handle_request(message: Dict[str, Any], writer: asyncio.StreamWriter) -> None:
+    try:
+        result = await operations[message["op"]](**message["args"])
+        response = {"id": message["id"], "result": result}
+    except HTTPException as e:
+        response = {"id": message["id"], "error": {"status_code": e.status_code, "detail": e.detail}}
+    except Exception as e:
+        logger.error(f"IPC request error ({type(e).__name__}) {e}")
+        response = {"id": message["id"], "error": {"status_code": 400, "detail": "request error"}}
+
+    writer.write(encode_message(response))
+
+
+async def handle_ipc_client(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # requests are handled concurrently, ordering on the line is left to the processor queue
+    tasks: Set[asyncio.Task[None]] = set()
+    feed: ValueFeed | None = None
+    try:
+        while True:
+            line = await reader.readline()
+            if len(line) == 0:
+                break
+            message = json.loads(line)
+            if "id" not in message:
+                # value feed messages of a worker, they get no response
+                if feed is None:
+                    feed = ValueFeed(writer)
+                feed.handle(message["op"], message["args"])
+                continue
+            task = asyncio.create_task(handle_request(message, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (ConnectionError, CancelledError):
+        pass
+    finally:
+        if feed is not None:
+            feed.close()
+        for task in tasks:
+            task.cancel()
+        writer.close()
+
+
+async def run_ipc_server(path: str) -> None:
+    if os.path.exists(path):
+        os.unlink(path)
+
+    try:
+        server = await asyncio.start_unix_server(handle_ipc_client, path)
+        logger.info(f"IPC serving on {path}")
+        async with server:
+            await server.serve_forever()
+    except CancelledError:
+        return
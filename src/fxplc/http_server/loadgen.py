@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from fxplc.client.FXPLCClient import RegisterDef, RegisterType
+
+DefaultMix = "read=70,write=20,toggle=10"
+StartupTimeout = 30
+RequestTimeout = 30
+
+# variables used when the tool starts the server itself and no variables file is given
+DemoVariables = [f"  - name: VAR_D{i}\n    register: D{i}\n" for i in range(10)] + \
+                [f"  - name: VAR_M{i}\n    register: M{i}\n" for i in range(10)]
+
+
+@dataclass
+class OpStats:
+    latencies: List[float] = field(default_factory=list)
+    statuses: Dict[int, int] = field(default_factory=dict)
+    connection_errors: int = 0
+
+    @property
+    def count(self) -> int:
+        return sum(self.statuses.values()) + self.connection_errors
+
+
+@dataclass
+class Target:
+    bit_names: List[str]
+    number_names: List[str]
+
+
+def parse_mix(definition: str) -> Dict[str, int]:
+    mix = {}
+    for part in definition.split(","):
+        op, _, weight = part.partition("=")
+        if op not in ("read", "read_all", "write", "toggle"):
+            raise ValueError(f"unknown operation: {op}")
+        mix[op] = int(weight)
+    return mix
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if len(sorted_values) == 0:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+async def fetch_target(client: httpx.AsyncClient) -> Target:
+    resp = await client.get("/variable", params={"max_age": 3600})
+    resp.raise_for_status()
+    target = Target(bit_names=[], number_names=[])
+    for var in resp.json():
+        # structures can't be written, bits of words (D10.3) are used like bit variables
+        register_str, _, bit = var["register"].partition(".")
+        if isinstance(var["value"], dict):
+            continue
+        elif bit == "" and RegisterDef.parse(register_str).type in (RegisterType.Data, RegisterType.Counter):
+            target.number_names.append(var["name"])
+        else:
+            target.bit_names.append(var["name"])
+    return target
+
+
+def make_request(op: str, target: Target, rnd: random.Random) -> Tuple[str, str]:
+    if op == "read":
+        return "GET", f"/variable/{rnd.choice(target.bit_names + target.number_names)}"
+    elif op == "read_all":
+        return "GET", "/variable"
+    elif op == "write" and len(target.number_names) > 0:
+        return "PUT", f"/variable/{rnd.choice(target.number_names)}?value={rnd.randint(0, 1000)}"
+    elif op == "write":
+        return "PUT", f"/variable/{rnd.choice(target.bit_names)}?value={rnd.choice(['true', 'false'])}"
+    else:
+        return "PUT", f"/variable/{rnd.choice(target.bit_names)}/toggle"
+
+
+async def run_client(client: httpx.AsyncClient, target: Target, mix: Dict[str, int], deadline: float,
+                     think_time: float, seed: int, stats: Dict[str, OpStats]) -> None:
+    rnd = random.Random(seed)
+    ops, weights = list(mix.keys()), list(mix.values())
+    while time.monotonic() < deadline:
+        op = rnd.choices(ops, weights)[0]
+        method, url = make_request(op, target, rnd)
+        op_stats = stats.setdefault(op, OpStats())
+
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url)
+            op_stats.latencies.append(time.perf_counter() - start)
+            op_stats.statuses[resp.status_code] = op_stats.statuses.get(resp.status_code, 0) + 1
+        except httpx.HTTPError:
+            op_stats.connection_errors += 1
+
+        if think_time > 0:
+            await asyncio.sleep(think_time)
+
+
+def summarize(stats: Dict[str, OpStats], elapsed: float) -> Dict[str, Any]:
+    def summarize_op(op_stats: OpStats) -> Dict[str, Any]:
+        latencies = sorted(op_stats.latencies)
+        count = max(op_stats.count, 1)
+        return {
+            "requests": op_stats.count,
+            "ok": sum(n for status, n in op_stats.statuses.items() if status < 400),
+            "rate_429": op_stats.statuses.get(429, 0) / count,
+            "rate_503": op_stats.statuses.get(503, 0) / count,
+            "connection_errors": op_stats.connection_errors,
+            "statuses": {str(k): v for k, v in sorted(op_stats.statuses.items())},
+            "latency_ms": {
+                "p50": percentile(latencies, 50) * 1000,
+                "p90": percentile(latencies, 90) * 1000,
+                "p99": percentile(latencies, 99) * 1000,
+                "max": latencies[-1] * 1000 if len(latencies) > 0 else 0,
+            },
+        }
+
+    total = OpStats()
+    for op_stats in stats.values():
+        total.latencies += op_stats.latencies
+        total.connection_errors += op_stats.connection_errors
+        for status, n in op_stats.statuses.items():
+            total.statuses[status] = total.statuses.get(status, 0) + n
+
+    summary = summarize_op(total)
+    summary["duration"] = elapsed
+    summary["throughput"] = total.count / elapsed
+    summary["operations"] = {op: summarize_op(op_stats) for op, op_stats in sorted(stats.items())}
+    return summary
+
+
+def format_report(summary: Dict[str, Any]) -> List[str]:
+    def format_line(name: str, s: Dict[str, Any]) -> str:
+        lat = s["latency_ms"]
+        return (f"{name:<10} {s['requests']:>8} {s['ok']:>8} {s['rate_429']:>7.1%} {s['rate_503']:>7.1%} "
+                f"{lat['p50']:>8.1f} {lat['p90']:>8.1f} {lat['p99']:>8.1f} {lat['max']:>8.1f}")
+
+    lines = [
+        f"duration: {summary['duration']:.1f}s, throughput: {summary['throughput']:.1f} req/s",
+        f"{'operation':<10} {'requests':>8} {'ok':>8} {'429':>7} {'503':>7} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+    ]
+    for op, op_summary in summary["operations"].items():
+        lines.append(format_line(op, op_summary))
+    lines.append(format_line("total", summary))
+    return lines
+
+
+def spawn_server(args: Any, port: int) -> Tuple[subprocess.Popen[bytes], str | None]:
+    variables_path = args.variables
+    temp_path = None
+    if variables_path is None:
+        fd, temp_path = tempfile.mkstemp(suffix=".yaml", prefix="fxplc-loadgen-")
+        with os.fdopen(fd, "wt") as f:
+            f.write("variables:\n" + "".join(DemoVariables))
+        variables_path = temp_path
+
+    cmd = [sys.executable, "-m", "fxplc.http_server", "--path", args.path, "--variables", variables_path,
+           "--no-ui", "--port", str(port), "--workers", str(args.workers)]
+    return subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), temp_path
+
+
+async def wait_for_server(client: httpx.AsyncClient) -> None:
+    deadline = time.monotonic() + StartupTimeout
+    while True:
+        try:
+            resp = await client.get("/scan/stats")
+            if resp.status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        if time.monotonic() > deadline:
+            raise TimeoutError("server didn't start")
+        await asyncio.sleep(0.2)
+
+
+async def run_load(args: Any, url: str) -> Dict[str, Any]:
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=RequestTimeout) as client:
+        await wait_for_server(client)
+        target = await fetch_target(client)
+        mix = parse_mix(args.mix)
+        if len(target.bit_names) == 0:
+            mix.pop("toggle", None)
+
+        stats: Dict[str, OpStats] = {}
+        start = time.monotonic()
+        deadline = start + args.duration
+        await asyncio.gather(*[run_client(client, target, mix, deadline, args.think_time, args.seed + i, stats)
+                               for i in range(args.clients)])
+        return summarize(stats, time.monotonic() - start)
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="HTTP load generator for fxplc.http_server")
+    argparser.add_argument("--url", type=str, default=None,
+                           help="server to test, by default one is started with the --path transport")
+    argparser.add_argument("--path", type=str, default="sim",
+                           help="transport of the started server: sim, sim:BAUDRATE or a real one")
+    argparser.add_argument("--variables", type=str, default=None, help="variables file of the started server")
+    argparser.add_argument("--workers", type=int, default=1, help="HTTP workers of the started server")
+    argparser.add_argument("--port", type=int, default=8765, help="port of the started server")
+    argparser.add_argument("-c", "--clients", type=int, default=10, help="concurrent clients")
+    argparser.add_argument("-d", "--duration", type=float, default=10, help="test duration in seconds")
+    argparser.add_argument("--mix", type=str, default=DefaultMix,
+                           help=f"operation weights, operations: read, read_all, write, toggle (default: {DefaultMix})")
+    argparser.add_argument("--think-time", type=float, default=0, help="pause of each client between requests")
+    argparser.add_argument("--seed", type=int, default=0)
+    argparser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = argparser.parse_args()
+
+    server = None
+    temp_path = None
+    url = args.url
+    if url is None:
+        server, temp_path = spawn_server(args, args.port)
+        url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        summary = asyncio.run(run_load(args, url))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if temp_path is not None:
+            os.unlink(temp_path)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        for line in format_report(summary):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
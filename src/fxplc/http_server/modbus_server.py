@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import struct
+from asyncio import CancelledError
+from typing import Dict, List, Tuple
+
+from fxplc.client.FXPLCClient import FXPLCClient, RegisterDef
+from fxplc.client.batch import BatchItem, read_items, register_sequence
+from fxplc.client.number_type import NumberType
+from fxplc.http_server.mytypes import ModbusMapping, ModbusBlock
+from fxplc.http_server.processor import do_request
+
+logger = logging.getLogger("fxplc.modbus")
+
+DefaultHoldingRegisters = ModbusBlock(address=0, register="D0", count=512)
+DefaultCoils = ModbusBlock(address=0, register="M0", count=1024)
+
+# quantity limits of the Modbus specification, so every response fits a PDU
+MaxReadCoils = 2000
+MaxReadRegisters = 125
+MaxWriteCoils = 1968
+MaxWriteRegisters = 123
+# unit id plus a PDU of at most 253 bytes
+MaxMbapLength = 254
+
+
+class FunctionCode:
+    ReadCoils = 0x01
+    ReadHoldingRegisters = 0x03
+    ReadInputRegisters = 0x04
+    WriteSingleCoil = 0x05
+    WriteSingleRegister = 0x06
+    WriteMultipleCoils = 0x0f
+    WriteMultipleRegisters = 0x10
+
+
+class ExceptionCode:
+    IllegalFunction = 0x01
+    IllegalDataAddress = 0x02
+    IllegalDataValue = 0x03
+    GatewayTargetFailed = 0x0b
+
+
+class ModbusError(Exception):
+    def __init__(self, code: int) -> None:
+        super().__init__(f"modbus exception {code}")
+        self.code = code
+
+
+def expand_blocks(blocks: List[ModbusBlock]) -> Dict[int, RegisterDef]:
+    mapping: Dict[int, RegisterDef] = {}
+    for block in blocks:
+        for i, reg in enumerate(register_sequence(RegisterDef.parse(block.register), block.count)):
+            mapping[block.address + i] = reg
+    return mapping
+
+
+class ModbusMap:
+    def __init__(self, mapping: ModbusMapping | None) -> None:
+        if mapping is None:
+            mapping = ModbusMapping(holding_registers=[DefaultHoldingRegisters], coils=[DefaultCoils])
+        self.holding_registers = expand_blocks(mapping.holding_registers)
+        self.coils = expand_blocks(mapping.coils)
+
+    @staticmethod
+    def resolve(table: Dict[int, RegisterDef], start: int, quantity: int) -> List[RegisterDef]:
+        registers = [table.get(x) for x in range(start, start + quantity)]
+        if quantity == 0 or any(x is None for x in registers):
+            raise ModbusError(ExceptionCode.IllegalDataAddress)
+        return [x for x in registers if x is not None]
+
+
+def check_quantity(quantity: int, maximum: int) -> None:
+    # checked before the addresses, and before anything is sent to the PLC
+    if not 1 <= quantity <= maximum:
+        raise ModbusError(ExceptionCode.IllegalDataValue)
+
+
+def pack_bits(bits: List[bool]) -> bytes:
+    out = bytearray((len(bits) + 7) // 8)
+    for i, bit in enumerate(bits):
+        if bit:
+            out[i // 8] |= 1 << (i % 8)
+    return bytes(out)
+
+
+def unpack_bits(data: bytes, count: int) -> List[bool]:
+    return [(data[i // 8] >> (i % 8)) & 1 != 0 for i in range(count)]
+
+
+async def write_words(fx: FXPLCClient, registers: List[RegisterDef], values: List[int]) -> None:
+    # consecutive registers are written with as few BYTE_WRITE frames as possible
+    words = sorted((reg.get_data_address(), value) for reg, value in zip(registers, values))
+    chunks: List[Tuple[int, bytes]] = []
+    for addr, value in words:
+        data = struct.pack("<H", value)
+        if len(chunks) > 0 and chunks[-1][0] + len(chunks[-1][1]) == addr:
+            chunks[-1] = (chunks[-1][0], chunks[-1][1] + data)
+        else:
+            chunks.append((addr, data))
+    for addr, data in chunks:
+        await fx.write_memory(addr, data)
+
+
+async def read_registers(registers: List[RegisterDef], as_bits: bool) -> List[int | float | bool]:
+    if as_bits:
+        items = [BatchItem.for_bit(reg, name=str(i)) for i, reg in enumerate(registers)]
+    else:
+        items = [BatchItem.for_number(reg, NumberType.WordUnsigned, name=str(i)) for i, reg in enumerate(registers)]
+
+    async def cb(fx: FXPLCClient) -> Dict[str, int | float | bool]:
+        return await read_items(fx, items)
+
+    values = await do_request(cb, f"MODBUS READ {registers[0]}+{len(registers)}")
+    return [values[str(i)] for i in range(len(registers))]
+
+
+async def write_bits(registers: List[RegisterDef], values: List[bool]) -> None:
+    async def cb(fx: FXPLCClient) -> None:
+        await fx.write_bits(list(zip(registers, values)))
+
+    await do_request(cb, f"MODBUS WRITE {registers[0]}+{len(registers)}")
+
+
+async def write_registers(registers: List[RegisterDef], values: List[int]) -> None:
+    async def cb(fx: FXPLCClient) -> None:
+        await write_words(fx, registers, values)
+
+    await do_request(cb, f"MODBUS WRITE {registers[0]}+{len(registers)}")
+
+
+async def process_pdu(modbus_map: ModbusMap, pdu: bytes) -> bytes:
+    function = pdu[0]
+    if function in (FunctionCode.ReadCoils,):
+        start, quantity = struct.unpack(">HH", pdu[1:5])
+        check_quantity(quantity, MaxReadCoils)
+        registers = ModbusMap.resolve(modbus_map.coils, start, quantity)
+        bits = await read_registers(registers, as_bits=True)
+        data = pack_bits([bool(x) for x in bits])
+        return bytes([function, len(data)]) + data
+    elif function in (FunctionCode.ReadHoldingRegisters, FunctionCode.ReadInputRegisters):
+        start, quantity = struct.unpack(">HH", pdu[1:5])
+        check_quantity(quantity, MaxReadRegisters)
+        registers = ModbusMap.resolve(modbus_map.holding_registers, start, quantity)
+        words = await read_registers(registers, as_bits=False)
+        data = struct.pack(f">{len(words)}H", *(int(x) for x in words))
+        return bytes([function, len(data)]) + data
+    elif function == FunctionCode.WriteSingleCoil:
+        address, value = struct.unpack(">HH", pdu[1:5])
+        if value not in (0x0000, 0xff00):
+            raise ModbusError(ExceptionCode.IllegalDataValue)
+        await write_bits(ModbusMap.resolve(modbus_map.coils, address, 1), [value == 0xff00])
+        return pdu[:5]
+    elif function == FunctionCode.WriteSingleRegister:
+        address, value = struct.unpack(">HH", pdu[1:5])
+        await write_registers(ModbusMap.resolve(modbus_map.holding_registers, address, 1), [value])
+        return pdu[:5]
+    elif function == FunctionCode.WriteMultipleCoils:
+        start, quantity, byte_count = struct.unpack(">HHB", pdu[1:6])
+        check_quantity(quantity, MaxWriteCoils)
+        if byte_count != (quantity + 7) // 8 or len(pdu) < 6 + byte_count:
+            raise ModbusError(ExceptionCode.IllegalDataValue)
+        registers = ModbusMap.resolve(modbus_map.coils, start, quantity)
+        await write_bits(registers, unpack_bits(pdu[6:6 + byte_count], quantity))
+        return pdu[:5]
+    elif function == FunctionCode.WriteMultipleRegisters:
+        start, quantity, byte_count = struct.unpack(">HHB", pdu[1:6])
+        check_quantity(quantity, MaxWriteRegisters)
+        if byte_count != quantity * 2 or len(pdu) < 6 + byte_count:
+            raise ModbusError(ExceptionCode.IllegalDataValue)
+        registers = ModbusMap.resolve(modbus_map.holding_registers, start, quantity)
+        await write_registers(registers, list(struct.unpack(f">{quantity}H", pdu[6:6 + byte_count])))
+        return pdu[:5]
+    else:
+        raise ModbusError(ExceptionCode.IllegalFunction)
+
+
+async def handle_modbus_client(modbus_map: ModbusMap, reader: asyncio.StreamReader,
+                               writer: asyncio.StreamWriter) -> None:
+    peer = writer.get_extra_info("peername")
+    logger.info(f"Modbus client connected: {peer}")
+    try:
+        while True:
+            header = await reader.readexactly(7)
+            transaction_id, protocol_id, length, unit_id = struct.unpack(">HHHB", header)
+            if not 2 <= length <= MaxMbapLength:
+                # the frame boundaries are lost, so is the connection
+                logger.warning(f"Modbus client {peer} sent an invalid frame length {length}")
+                break
+            pdu = await reader.readexactly(length - 1)
+            if protocol_id != 0 or len(pdu) == 0:
+                continue
+
+            try:
+                response = await process_pdu(modbus_map, pdu)
+            except ModbusError as e:
+                response = bytes([pdu[0] | 0x80, e.code])
+            except struct.error:
+                response = bytes([pdu[0] | 0x80, ExceptionCode.IllegalDataValue])
+            except Exception as e:
+                logger.warning(f"Modbus request failed ({type(e).__name__}): {e}")
+                response = bytes([pdu[0] | 0x80, ExceptionCode.GatewayTargetFailed])
+
+            writer.write(struct.pack(">HHHB", transaction_id, 0, len(response) + 1, unit_id) + response)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, CancelledError):
+        pass
+    finally:
+        logger.info(f"Modbus client disconnected: {peer}")
+        writer.close()
+
+
+async def run_modbus_server(mapping: ModbusMapping | None, port: int) -> None:
+    modbus_map = ModbusMap(mapping)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await handle_modbus_client(modbus_map, reader, writer)
+
+    try:
+        server = await asyncio.start_server(handle, '0.0.0.0', port)
+        addresses = ', '.join(str(sock.getsockname()) for sock in server.sockets)
+        logger.info(f"Modbus TCP serving on {addresses}")
+        async with server:
+            await server.serve_forever()
+    except CancelledError:
+        return
@@ -1,25 +1,89 @@
-from typing import List, Optional
+import enum
+from dataclasses import field
+from typing import Dict, List, Optional
 
 from pydantic.dataclasses import dataclass
 
 from fxplc.client.number_type import NumberType
 
+ScalarValue = int | float | bool
+# structure variables are read as a dict of their fields
+VariableValue = ScalarValue | Dict[str, ScalarValue]
+
+
+@dataclass
+class StructureField:
+    name: str
+    # position in words from the variable's register, e.g. 2 for D102 in a structure at D100
+    word: int = 0
+    number_type: NumberType = NumberType.WordSigned
+    bit: Optional[int] = None
+    gain: float = 1
+    offset: float = 0
+
 
 @dataclass
 class VariableDefinition:
     name: str
+    # a bit of a word register can be given as D10.3
     register: str
     group: Optional[str] = None
     number_type: NumberType = NumberType.WordSigned
     readonly: bool = False
+    deadband: float = 0
+    scan_class: float = 1
+    # value = raw * gain + offset
+    gain: float = 1
+    offset: float = 0
+    units: Optional[str] = None
+    # the variable is a structure of several fields read together
+    fields: Optional[List[StructureField]] = None
+
+
+@dataclass
+class ModbusBlock:
+    address: int
+    register: str
+    count: int = 1
+
+
+@dataclass
+class ModbusMapping:
+    holding_registers: List[ModbusBlock] = field(default_factory=list)
+    coils: List[ModbusBlock] = field(default_factory=list)
+
+
+class ConditionKind(enum.Enum):
+    High = "high"
+    Low = "low"
+    Rising = "rising"
+    Falling = "falling"
+    Rate = "rate"
+
+
+@dataclass
+class ConditionDefinition:
+    name: str
+    variable: str
+    kind: ConditionKind
+    # threshold of high/low, units per second for rate
+    limit: float = 0
+    # high/low/rate clear only once the value is back by this much
+    deadband: float = 0
+    # field of a structure variable
+    field: Optional[str] = None
 
 
 @dataclass
 class VariablesFile:
     variables: List[VariableDefinition]
+    modbus: Optional[ModbusMapping] = None
+    conditions: List[ConditionDefinition] = field(default_factory=list)
 
 
 class RuntimeSettings:
     def __init__(self) -> None:
         self.variables: List[VariableDefinition] = []
+        self.modbus: Optional[ModbusMapping] = None
+        self.conditions: List[ConditionDefinition] = []
         self.rest_enabled = True
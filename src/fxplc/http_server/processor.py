@@ -1,19 +1,26 @@
 import asyncio
 import logging
 import os
+import random
+import struct
 import traceback
 from asyncio import QueueFull
 from contextlib import closing
-from typing import Any, Callable, Awaitable, TypeVar
+from typing import Any, Callable, Awaitable, Dict, List, Tuple, TypeVar, cast
 
 from fastapi import HTTPException
 
 from fxplc.client.FXPLCClient import FXPLCClient, RegisterDef, RegisterType
 from fxplc.client.FXPLCClientMock import FXPLCClientMock
-from fxplc.client.errors import ResponseMalformedError, NoResponseError
-from fxplc.client.number_type import NumberType
-from fxplc.http_server.exceptions import RequestException, RequestTimeoutException
+from fxplc.client.batch import BatchItem, NumberRegisterTypes, read_items
+from fxplc.client.errors import ResponseMalformedError, NoResponseError, InvalidRegisterError
+from fxplc.client.models import PlcModel
+from fxplc.client.number_type import NumberType, register_type_converters
+from fxplc.http_server.circuit_breaker import CircuitBreaker, RetryBudget, BreakerState
+from fxplc.http_server.exceptions import RequestException, RequestTimeoutException, CircuitOpenException
+from fxplc.http_server.ipc import IpcClient
 from fxplc.http_server.transport import connect_to_transport, TransportConfig
+from fxplc.transports.TransportTCP import NotConnectedError
 
 logger = logging.getLogger("fxplc.server")
 
@@ -21,40 +28,121 @@ logger = logging.getLogger("fxplc.server")
 class FXRequest:
     future: asyncio.Future[Any]
     callback: Callable[[FXPLCClient], Awaitable[Any]]
+    coalesce_key: str | None = None
+    # PLC memory touched by the request as (byte address, size), None if it isn't known
+    spans: List[Tuple[int, int]] | None = None
 
 
 T = TypeVar("T")
 
 RequestTimeout = 10
+HeartbeatInterval = 5
+MaxConsecutiveFailures = 3
+ReconnectDelayMin = 0.5
+ReconnectDelayMax = 30
+RetryCount = 5
+RetryDelay = 0.5
 
 transport_config: TransportConfig | None = None
+plc_model: PlcModel | None = None
 serial_task_handle: asyncio.Task[None] | None = None
 queue = asyncio.Queue[FXRequest](maxsize=10)
+reconnect_delay: float = ReconnectDelayMin
+consecutive_failures = 0
+breaker = CircuitBreaker()
+# set in HTTP worker processes, the requests are then executed by the serial owner process
+ipc_client: IpcClient | None = None
+retry_budget = RetryBudget()
+# queued writes that haven't been taken by the serial task yet and are still the newest job on their registers,
+# by register and width
+pending_writes: Dict[str, FXRequest] = {}
+
+
+def resolve_register(register: str, number_type: NumberType = NumberType.WordSigned) -> RegisterDef:
+    # like FXPLCClient._resolve, but before the request takes a queue slot and with the reason for the caller
+    register_def = RegisterDef.parse(register)
+    if plc_model is not None:
+        count = 1
+        if register_def.type in NumberRegisterTypes:
+            count = struct.calcsize(register_type_converters[number_type].format_str) // 2
+        try:
+            plc_model.check_register(register_def.type.value, register_def.num, count)
+        except InvalidRegisterError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return register_def
+
+
+def register_spans(register_def: RegisterDef, number_type: NumberType) -> List[Tuple[int, int]] | None:
+    try:
+        item = BatchItem.for_register(register_def, number_type)
+    except (ValueError, KeyError):
+        return None
+    return [(item.address, item.size)]
 
 
-async def do_request(callback: Callable[[FXPLCClient], Awaitable[T]], opname: str) -> T:
+def spans_overlap(a: List[Tuple[int, int]] | None, b: List[Tuple[int, int]] | None) -> bool:
+    if a is None or b is None:
+        return True
+    return any(a_addr < b_addr + b_size and b_addr < a_addr + a_size for a_addr, a_size in a for b_addr, b_size in b)
+
+
+async def do_request(callback: Callable[[FXPLCClient], Awaitable[T]], opname: str,
+                     coalesce_key: str | None = None, spans: List[Tuple[int, int]] | None = None) -> T:
     if not is_running():
         raise HTTPException(status_code=503, detail="server is paused")
 
+    if not breaker.allow_request():
+        raise HTTPException(status_code=503, detail="PLC unavailable (circuit open)")
+
+    if coalesce_key is not None:
+        # last writer wins, the queued write is sent with the newest value and all merged callers get its result
+        pending = pending_writes.get(coalesce_key)
+        if pending is not None and not pending.future.done():
+            logger.debug(f"request coalesced: {opname}")
+            pending.callback = callback
+            return cast(T, await wait_for_request(pending))
+
     logger.debug(f"request: {opname}")
 
     fxr = FXRequest()
     fxr.future = asyncio.Future[T]()
     fxr.callback = callback
+    fxr.coalesce_key = coalesce_key
+    fxr.spans = spans
 
     try:
         queue.put_nowait(fxr)
-        return await asyncio.wait_for(fxr.future, RequestTimeout)
     except QueueFull:
+        breaker.release_probe()
         raise HTTPException(status_code=429, detail="requests queue full")
+
+    # merging a newer value into a write with other jobs on its registers queued after it would reorder them
+    for key, pending in list(pending_writes.items()):
+        if spans_overlap(pending.spans, spans):
+            del pending_writes[key]
+    if coalesce_key is not None:
+        pending_writes[coalesce_key] = fxr
+    return cast(T, await wait_for_request(fxr))
+
+
+async def wait_for_request(fxr: FXRequest) -> Any:
+    # a shared request must not be cancelled by a timeout of just one of its callers
+    future = asyncio.shield(fxr.future) if fxr.coalesce_key is not None else fxr.future
+    try:
+        return await asyncio.wait_for(future, RequestTimeout)
     except TimeoutError:
         raise HTTPException(status_code=400, detail="request timeout")
     except RequestException:
         raise HTTPException(status_code=400, detail="request error")
+    except CircuitOpenException:
+        raise HTTPException(status_code=503, detail="PLC unavailable (circuit open)")
 
 
 async def perform_register_read(register: str, number_type: NumberType) -> int | float | bool:
-    register_def = RegisterDef.parse(register)
+    if ipc_client is not None:
+        return cast(int | float | bool, await ipc_client.call("read", register=register, number_type=number_type.value))
+
+    register_def = resolve_register(register, number_type)
 
     async def cb(fx: FXPLCClient) -> int | float | bool:
         if register_def.type in (RegisterType.Input, RegisterType.Output, RegisterType.Memory,
@@ -65,47 +153,190 @@ async def perform_register_read(register: str, number_type: NumberType) -> int |
         else:
             raise Exception("unsupported")
 
-    return await do_request(cb, f"READ {register}")
+    return await do_request(cb, f"READ {register}", spans=register_spans(register_def, number_type))
 
 
-async def perform_register_write(register: str, value: int | bool, number_type: NumberType) -> int | bool:
-    register_def = RegisterDef.parse(register)
+async def perform_register_write(register: str, value: int | float | bool,
+                                 number_type: NumberType) -> int | float | bool:
+    if ipc_client is not None:
+        return cast(int | float | bool, await ipc_client.call("write", register=register, value=value,
+                                                              number_type=number_type.value))
 
-    async def cb(fx: FXPLCClient) -> int | bool:
+    register_def = resolve_register(register, number_type)
+
+    async def cb(fx: FXPLCClient) -> int | float | bool:
         if register_def.type in (RegisterType.Input, RegisterType.Output, RegisterType.Memory,
                                  RegisterType.State, RegisterType.Timer):
             await fx.write_bit(register_def, bool(value))
             return bool(value)
         elif register_def.type in (RegisterType.Data, RegisterType.Counter):
-            await fx.write_number(register_def, int(value), number_type)
-            return int(value)
+            number = float(value) if number_type == NumberType.Float else int(value)
+            await fx.write_number(register_def, number, number_type)
+            return number
         else:
             raise Exception("unsupported")
 
-    return await do_request(cb, f"WRITE {register}={value}")
+    return await do_request(cb, f"WRITE {register}={value}", coalesce_key=f"{register_def}:{number_type.value}",
+                            spans=register_spans(register_def, number_type))
 
 
 async def perform_register_read_bit(register: str) -> bool:
-    register_def = RegisterDef.parse(register)
+    if ipc_client is not None:
+        return cast(bool, await ipc_client.call("read_bit", register=register))
+
+    register_def = resolve_register(register)
 
     async def cb(fx: FXPLCClient) -> bool:
         return await fx.read_bit(register_def)
 
-    return await do_request(cb, f"READ_BIT {register}")
+    return await do_request(cb, f"READ_BIT {register}", spans=register_spans(register_def, NumberType.WordSigned))
 
 
 async def perform_register_write_bit(register: str, value: bool) -> int:
-    register_def = RegisterDef.parse(register)
+    if ipc_client is not None:
+        return cast(int, await ipc_client.call("write_bit", register=register, value=value))
+
+    register_def = resolve_register(register)
 
     async def cb(fx: FXPLCClient) -> bool:
         await fx.write_bit(register_def, value)
         return bool(value)
 
-    return await do_request(cb, f"WRITE_BIT {register}={value}")
+    return await do_request(cb, f"WRITE_BIT {register}={value}", coalesce_key=str(register_def),
+                            spans=register_spans(register_def, NumberType.WordSigned))
+
+
+async def perform_batch_read(registers: List[Tuple[str, NumberType]]) -> List[int | float | bool]:
+    if ipc_client is not None:
+        return cast(List[int | float | bool], await ipc_client.call(
+            "read_batch", registers=[[register, number_type.value] for register, number_type in registers]))
+
+    for register, number_type in registers:
+        register_str, _, bit_str = register.partition(".")
+        resolve_register(register_str, NumberType.WordSigned if bit_str != "" else number_type)
+    items = [BatchItem.parse(register, number_type, name=str(i)) for i, (register, number_type) in enumerate(registers)]
+
+    async def cb(fx: FXPLCClient) -> List[int | float | bool]:
+        values = await read_items(fx, items)
+        return [values[item.name] for item in items]
+
+    return await do_request(cb, f"READ_BATCH {len(items)}", spans=[(x.address, x.size) for x in items])
+
+
+def wrap_number(value: int | float, number_type: NumberType) -> int | float:
+    # like the PLC's INC/DEC instructions, integers wrap around at the limits of their type
+    if number_type == NumberType.Float:
+        return value
+    bits = 16 if number_type in (NumberType.WordSigned, NumberType.WordUnsigned) else 32
+    wrapped = int(value) % (1 << bits)
+    if number_type in (NumberType.WordSigned, NumberType.DoubleWordSigned) and wrapped >= 1 << (bits - 1):
+        wrapped -= 1 << bits
+    return wrapped
+
+
+async def perform_word_update(register: str, number_type: NumberType, update: Callable[[int | float], int | float],
+                              opname: str, coalesce_key: str | None = None) -> Tuple[int | float, int | float]:
+    register_def = resolve_register(register, number_type)
+    if register_def.type not in (RegisterType.Data, RegisterType.Counter):
+        raise HTTPException(status_code=400, detail="not a word register")
+
+    computed: Tuple[int | float, int | float] | None = None
+
+    async def cb(fx: FXPLCClient) -> Tuple[int | float, int | float]:
+        nonlocal computed
+        # read and write are one job, so no other request gets between them; the new value is computed from the
+        # first read only, so a retry after a lost write response can't apply the operation twice
+        if computed is None:
+            old = await fx.read_number(register_def, number_type)
+            computed = old, update(old)
+        old, new = computed
+        if new != old:
+            await fx.write_number(register_def, new, number_type)
+        return old, new
+
+    return await do_request(cb, opname, coalesce_key=coalesce_key, spans=register_spans(register_def, number_type))
+
+
+async def perform_word_bit_write(register: str, bit: int, value: bool) -> bool:
+    if ipc_client is not None:
+        return cast(bool, await ipc_client.call("write_word_bit", register=register, bit=bit, value=value))
+
+    if not 0 <= bit < 16:
+        raise HTTPException(status_code=400, detail="invalid word bit")
+
+    def update(word: int | float) -> int:
+        return int(word) | (1 << bit) if value else int(word) & ~(1 << bit)
+
+    await perform_word_update(register, NumberType.WordUnsigned, update, f"WRITE_WORD_BIT {register}.{bit}={value}",
+                              coalesce_key=f"{RegisterDef.parse(register)}.{bit}")
+    return value
+
+
+async def perform_register_add(register: str, delta: int | float, number_type: NumberType) -> int | float:
+    if ipc_client is not None:
+        return cast(int | float, await ipc_client.call("add", register=register, delta=delta,
+                                                       number_type=number_type.value))
+
+    _, new = await perform_word_update(register, number_type, lambda x: wrap_number(x + delta, number_type),
+                                       f"ADD {register}+={delta}")
+    return new
+
+
+async def perform_word_mask(register: str, set_mask: int = 0, clear_mask: int = 0, toggle_mask: int = 0) -> int:
+    if ipc_client is not None:
+        return cast(int, await ipc_client.call("mask", register=register, set_mask=set_mask, clear_mask=clear_mask,
+                                               toggle_mask=toggle_mask))
+
+    def update(word: int | float) -> int:
+        return ((int(word) | set_mask) & ~clear_mask & 0xffff) ^ (toggle_mask & 0xffff)
+
+    opname = f"MASK {register} set={set_mask:#x} clear={clear_mask:#x} toggle={toggle_mask:#x}"
+    _, new = await perform_word_update(register, NumberType.WordUnsigned, update, opname)
+    return int(new)
+
+
+async def perform_compare_and_set(register: str, expected: int | float, value: int | float,
+                                  number_type: NumberType) -> Tuple[bool, int | float]:
+    if ipc_client is not None:
+        swapped, current = await ipc_client.call("compare_and_set", register=register, expected=expected, value=value,
+                                                 number_type=number_type.value)
+        return swapped, current
+
+    old, new = await perform_word_update(register, number_type, lambda x: value if x == expected else x,
+                                         f"CAS {register} {expected}->{value}")
+    return old == expected, new
+
+
+async def perform_register_toggle_bit(register: str) -> bool:
+    if ipc_client is not None:
+        return cast(bool, await ipc_client.call("toggle_bit", register=register))
+
+    register_def = resolve_register(register)
+    new_value: bool | None = None
+
+    async def cb(fx: FXPLCClient) -> bool:
+        nonlocal new_value
+        # as in perform_word_update, a retry writes the state computed from the first read
+        if new_value is None:
+            new_value = not await fx.read_bit(register_def)
+        await fx.write_bit(register_def, new_value)
+        return new_value
+
+    return await do_request(cb, f"TOGGLE_BIT {register}", spans=register_spans(register_def, NumberType.WordSigned))
+
+
+async def perform_raw_frame(frame: bytes) -> bytes:
+    async def cb(fx: FXPLCClient) -> bytes:
+        return await fx.send_raw_frame(frame)
+
+    return await do_request(cb, "RAW_FRAME")
 
 
 async def serial_task() -> None:
+    global reconnect_delay
+
     logging.info("serial task started")
+    reconnect_delay = ReconnectDelayMin
     while True:
         try:
             await serial_task_loop()
@@ -114,55 +345,144 @@ async def serial_task() -> None:
             return
         except (ConnectionRefusedError, ConnectionError, TimeoutError) as e:
             logging.warning(f"connection error ({type(e).__name__}): {e}")
-            await asyncio.sleep(1)
+            breaker.record_failure()
         except:
             traceback.print_exc()
-            await asyncio.sleep(1)
+            breaker.record_failure()
+
+        # failed heartbeats and requests have recorded their failure already
+        if breaker.state == BreakerState.Open:
+            fail_queued_requests()
+
+        # exponential backoff with jitter, reset by the first successful request on the new connection
+        delay = reconnect_delay * random.uniform(0.5, 1)
+        reconnect_delay = min(reconnect_delay * 2, ReconnectDelayMax)
+        logging.info(f"reconnecting in {delay:.1f}s")
+        await asyncio.sleep(delay)
 
 
 async def serial_task_loop() -> None:
+    global consecutive_failures
+
     if transport_config is None:
         raise Exception("transport_config is not configured")
 
     logging.info("connecting to FX...")
     transport = await connect_to_transport(transport_config)
-    client_cls = FXPLCClient(transport)
+    client_cls = FXPLCClient(transport, model=plc_model)
     if os.getenv("DEMO") == "1":
         client_cls = FXPLCClientMock()
+    consecutive_failures = 0
+    get_task: asyncio.Task[FXRequest] | None = None
     with closing(client_cls) as fx:
         logging.info("connection opened")
-        while True:
-            req = await queue.get()
-            if not await perform_single_request(fx, req):
-                logging.info("request processing error")
-                return
+        try:
+            while True:
+                # the pending get is kept across heartbeats, so no request can be lost on the timeout
+                if get_task is None:
+                    get_task = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait({get_task}, timeout=HeartbeatInterval)
+                if len(done) == 0:
+                    if not await perform_heartbeat(fx):
+                        logging.warning("heartbeat failed, reconnecting")
+                        return
+                    continue
+
+                req = get_task.result()
+                get_task = None
+                if not await perform_single_request(fx, req):
+                    logging.info("request processing error")
+                    return
+        finally:
+            if get_task is not None:
+                get_task.cancel()
+
+
+def mark_success() -> None:
+    global consecutive_failures, reconnect_delay
+    consecutive_failures = 0
+    reconnect_delay = ReconnectDelayMin
+    breaker.record_success()
+
+
+def fail_queued_requests() -> None:
+    pending_writes.clear()
+    while not queue.empty():
+        req = queue.get_nowait()
+        if not req.future.done():
+            req.future.set_exception(CircuitOpenException())
+
+
+async def perform_heartbeat(fx: FXPLCClient) -> bool:
+    try:
+        await fx.read_bytes(0, 1)
+        mark_success()
+        return True
+    except Exception as e:
+        logging.warning(f"heartbeat error ({type(e).__name__}) {e}")
+        breaker.record_failure()
+        return False
 
 
 async def perform_single_request(fx: FXPLCClient, req: FXRequest) -> bool:
-    for i in range(5):
+    global consecutive_failures
+
+    # from now on the request is in flight, a newer write to the register gets queued on its own
+    if req.coalesce_key is not None and pending_writes.get(req.coalesce_key) is req:
+        del pending_writes[req.coalesce_key]
+
+    if req.future.done():
+        breaker.release_probe()
+        return True
+
+    # requests admitted before the breaker opened don't wait for their own retries
+    if breaker.state == BreakerState.Open:
+        req.future.set_exception(CircuitOpenException())
+        return True
+
+    retry_budget.deposit()
+    for i in range(RetryCount):
+        if i > 0:
+            if breaker.state != BreakerState.Closed or not retry_budget.withdraw():
+                break
+            await asyncio.sleep(RetryDelay)
         try:
             if req.future.done():
+                breaker.release_probe()
                 return True
             res = await req.callback(fx)
             if not req.future.done():
                 req.future.set_result(res)
+            mark_success()
             return True
         except (ResponseMalformedError, NoResponseError) as e:
             logging.error(f"retryable request error ({type(e).__name__}) {e}")
-            await asyncio.sleep(0.5)
+        except (OSError, NotConnectedError) as e:
+            logging.error(f"connection error ({type(e).__name__}) {e}")
+            if not req.future.done():
+                req.future.set_exception(RequestException())
+            breaker.record_failure()
+            return False
         except Exception as e:
             logging.error(f"general request error ({type(e).__name__}) {e}")
-            req.future.set_exception(RequestException())
-            return False
+            if not req.future.done():
+                req.future.set_exception(RequestException())
+            breaker.release_probe()
+            return True
 
     if not req.future.done():
         req.future.set_exception(RequestException())
-    return False
+    breaker.record_failure()
+
+    # the transport is kept open across protocol errors until the link looks dead
+    consecutive_failures += 1
+    return consecutive_failures < MaxConsecutiveFailures
 
 
-def run_serial_task(transport_config_: TransportConfig) -> None:
-    global transport_config
+def run_serial_task(transport_config_: TransportConfig, plc_model_: PlcModel | None = None) -> None:
+    global transport_config, plc_model
     transport_config = transport_config_
+    plc_model = plc_model_
 
     resume_serial()
 
@@ -182,6 +502,15 @@ def pause_serial() -> None:
     logging.info("task stopped")
 
 
+async def perform_set_running(running: bool) -> None:
+    if ipc_client is not None:
+        await ipc_client.call("set_running", running=running)
+    elif running:
+        resume_serial()
+    else:
+        pause_serial()
+
+
 def resume_serial() -> None:
     global serial_task_handle
 
@@ -0,0 +1,297 @@
+import argparse
+import asyncio
+import gc
+import json
+import linecache
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, MutableMapping, Tuple
+
+from fastapi import FastAPI
+
+from fxplc.http_server import processor, server
+from fxplc.http_server.mytypes import RuntimeSettings, VariableDefinition
+from fxplc.http_server.transport import TransportConfig
+
+# Fixed workload, so results of different runs and trees can be compared with each other
+Workload: List[Tuple[str, str, str, str]] = [
+    ("read", "GET", "/variable/VAR_D0", ""),
+    ("read_value", "GET", "/variable/VAR_D0/value", ""),
+    ("read_all", "GET", "/variable", ""),
+    ("write", "PUT", "/variable/VAR_D1", "value=42"),
+    ("toggle", "PUT", "/variable/VAR_M0/toggle", ""),
+    ("raw_read", "GET", "/raw/D5", ""),
+]
+
+WorkloadVariables = [VariableDefinition(name=f"VAR_D{i}", register=f"D{i}") for i in range(10)] + \
+                    [VariableDefinition(name=f"VAR_M{i}", register=f"M{i}") for i in range(10)] + \
+                    [VariableDefinition(name="VAR_BIT", register="D20.3"),
+                     VariableDefinition(name="VAR_SCALED", register="D21", gain=0.1, units="bar")]
+
+DefaultRequests = 2000
+WarmupRequests = 200
+LagTick = 0.001
+
+# a metric only regresses when it grows by more than the relative tolerance and by more than this much
+RegressionFloors = {
+    "cpu_us": 5.0,
+    "peak_bytes": 512.0,
+    "retained_bytes": 64.0,
+    "gc0_per_1k": 1.0,
+    "lag_p99_ms": 1.0,
+}
+
+
+@dataclass
+class OpResult:
+    requests: int
+    errors: int
+    cpu_us: float
+    wall_p50_us: float
+    wall_p99_us: float
+    peak_bytes: float
+    retained_bytes: float
+    gc0_per_1k: float
+    lag_p99_ms: float
+    lag_max_ms: float
+
+
+class AsgiCaller:
+    # drives the app without sockets or an HTTP client, so only the server's own overhead is measured
+    def __init__(self, app: FastAPI) -> None:
+        self._app = app
+
+    async def call(self, method: str, path: str, query: str) -> int:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method, "scheme": "http",
+            "path": path, "raw_path": path.encode("ascii"), "query_string": query.encode("ascii"), "root_path": "",
+            "headers": [(b"host", b"localhost"), (b"accept", b"application/json")],
+            "client": ("127.0.0.1", 40000), "server": ("127.0.0.1", 8000),
+        }
+        status = 0
+        sent = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal sent
+            if sent:
+                # nothing reads past the empty body, but a disconnect is the right answer if something does
+                return {"type": "http.disconnect"}
+            sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message: MutableMapping[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        await self._app(scope, receive, send)
+        return status
+
+
+class LagMonitor:
+    def __init__(self) -> None:
+        self.lags: List[float] = []
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(LagTick)
+            self.lags.append(time.perf_counter() - start - LagTick)
+
+    def start(self) -> None:
+        self.lags = []
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if len(sorted_values) == 0:
+        return 0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))]
+
+
+def create_app() -> FastAPI:
+    settings = RuntimeSettings()
+    settings.variables = WorkloadVariables
+    server.runtime_settings = settings
+
+    app = FastAPI(title="FXPLC server")
+    app.include_router(server.router)
+    server.add_compression(app)
+    return app
+
+
+async def measure_time(caller: AsgiCaller, method: str, path: str, query: str,
+                       requests: int) -> Tuple[int, float, List[float], float, List[float]]:
+    lag_monitor = LagMonitor()
+    walls = []
+    errors = 0
+    gc0_start = gc.get_stats()[0]["collections"]
+    lag_monitor.start()
+    cpu_start = time.process_time()
+    for _ in range(requests):
+        start = time.perf_counter()
+        if await caller.call(method, path, query) >= 400:
+            errors += 1
+        walls.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    lag_monitor.stop()
+    gc0 = gc.get_stats()[0]["collections"] - gc0_start
+    return errors, cpu, sorted(walls), gc0, sorted(lag_monitor.lags)
+
+
+async def measure_memory(caller: AsgiCaller, method: str, path: str, query: str,
+                         requests: int, top: int) -> Tuple[float, float, List[str]]:
+    gc.collect()
+    tracemalloc.start(10 if top > 0 else 1)
+    try:
+        start_snapshot = tracemalloc.take_snapshot() if top > 0 else None
+        # a running total, a list of samples would itself show up as retained memory
+        peak_total = 0
+        base = tracemalloc.get_traced_memory()[0]
+        for _ in range(requests):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            await caller.call(method, path, query)
+            peak_total += tracemalloc.get_traced_memory()[1] - before
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - base
+
+        sites = []
+        if start_snapshot is not None:
+            # memory still held after the run, by the fxplc line that allocated it
+            filters = [tracemalloc.Filter(True, "*fxplc*"), tracemalloc.Filter(False, __file__)]
+            snapshot = tracemalloc.take_snapshot().filter_traces(filters)
+            start_filtered = start_snapshot.filter_traces(filters)
+            for stat in snapshot.compare_to(start_filtered, "lineno")[:top]:
+                frame = stat.traceback[0]
+                line = linecache.getline(frame.filename, frame.lineno).strip()
+                sites.append(f"{stat.size_diff:+8d} B {stat.count_diff:+6d}  {frame.filename}:{frame.lineno}  {line}")
+    finally:
+        tracemalloc.stop()
+
+    return peak_total / requests, retained / requests, sites
+
+
+async def run_workload(requests: int, ops: List[str], top: int, rounds: int) -> Dict[str, OpResult]:
+    caller = AsgiCaller(create_app())
+    processor.run_serial_task(TransportConfig(path="sim"))
+
+    # the first requests pay for the connection, imports and caches
+    for _, method, path, query in Workload:
+        for _ in range(WarmupRequests // len(Workload)):
+            await caller.call(method, path, query)
+
+    results = {}
+    for name, method, path, query in Workload:
+        if name not in ops:
+            continue
+        # other processes on the machine only ever add time, so the best round is the most repeatable figure
+        round_results = []
+        for _ in range(rounds):
+            errors, cpu, walls, gc0, lags = await measure_time(caller, method, path, query, requests)
+            round_results.append(OpResult(
+                requests=requests,
+                errors=errors,
+                cpu_us=cpu / requests * 1e6,
+                wall_p50_us=percentile(walls, 50) * 1e6,
+                wall_p99_us=percentile(walls, 99) * 1e6,
+                peak_bytes=0,
+                retained_bytes=0,
+                gc0_per_1k=gc0 / requests * 1000,
+                lag_p99_ms=percentile(lags, 99) * 1000,
+                lag_max_ms=(lags[-1] if len(lags) > 0 else 0) * 1000,
+            ))
+        result = OpResult(**{k: min(getattr(x, k) for x in round_results) for k in asdict(round_results[0])})
+        result.errors = sum(x.errors for x in round_results)
+        result.peak_bytes, result.retained_bytes, sites = await measure_memory(caller, method, path, query,
+                                                                               requests, top)
+        results[name] = result
+        for site in sites:
+            print(f"[{name}] {site}", file=sys.stderr)
+
+    processor.pause_serial()
+    return results
+
+
+def compare(results: Dict[str, OpResult], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        for metric, floor in RegressionFloors.items():
+            old, new = base[metric], getattr(result, metric)
+            if new > old * (1 + tolerance) and new - old > floor:
+                regressions.append(f"{name}: {metric} {old:.1f} -> {new:.1f}")
+    return regressions
+
+
+def format_report(results: Dict[str, OpResult], baseline: Dict[str, Any] | None) -> List[str]:
+    def fmt(name: str, metric: str, value: float) -> str:
+        if baseline is None or name not in baseline:
+            return f"{value:>10.1f}"
+        old = baseline[name][metric]
+        change = (value - old) / old if old != 0 else 0
+        return f"{value:>10.1f}" + (f" {change:+5.0%}" if abs(change) >= 0.005 else "      ")
+
+    metrics = ["cpu_us", "wall_p99_us", "peak_bytes", "retained_bytes", "gc0_per_1k", "lag_p99_ms"]
+    width = 10 if baseline is None else 16
+    lines = [f"{'operation':<11} {'errors':>6} " + " ".join(f"{x:>{width}}" for x in metrics)]
+    for name, result in results.items():
+        values = " ".join(fmt(name, x, getattr(result, x)).ljust(width) for x in metrics)
+        lines.append(f"{name:<11} {result.errors:>6} {values}")
+    return lines
+
+
+def main() -> None:
+    argparser = argparse.ArgumentParser(description="request hot path profiling with an in-memory PLC")
+    argparser.add_argument("-n", "--requests", type=int, default=DefaultRequests, help="requests per operation")
+    argparser.add_argument("--ops", type=lambda x: x.split(","), default=[x[0] for x in Workload],
+                           help=f"operations to run (default: {','.join(x[0] for x in Workload)})")
+    argparser.add_argument("--rounds", type=int, default=3, help="timing rounds, the best one is reported")
+    argparser.add_argument("--top", type=int, default=0, help="show the fxplc lines retaining most memory")
+    argparser.add_argument("--baseline", type=str, metavar="FILE", help="compare with a saved baseline")
+    argparser.add_argument("--save-baseline", type=str, metavar="FILE", help="save the results as a baseline")
+    argparser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative growth of a metric")
+    argparser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = argparser.parse_args()
+
+    results = asyncio.run(run_workload(args.requests, args.ops, args.top, args.rounds))
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline, "rt") as f:
+            baseline = json.load(f)
+
+    if args.json:
+        print(json.dumps({name: asdict(x) for name, x in results.items()}, indent=2))
+    else:
+        for line in format_report(results, baseline):
+            print(line)
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "wt") as f:
+            json.dump({name: asdict(x) for name, x in results.items()}, f, indent=2)
+
+    if any(x.errors > 0 for x in results.values()):
+        print("some requests failed, the results don't measure the normal path", file=sys.stderr)
+        exit(1)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"regression: {line}", file=sys.stderr)
+        if len(regressions) > 0:
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+import asyncio
+import json
+import logging
+import secrets
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Tuple, cast
+
+from fxplc.client.batch import BatchItem, plan_spans, spans_wire_time
+from fxplc.http_server import processor
+from fxplc.http_server.ipc import encode_message
+from fxplc.http_server.mytypes import RuntimeSettings, VariableDefinition, VariableValue
+from fxplc.http_server.processor import is_running
+from fxplc.http_server.variables import read_variables, variable_reads
+
+logger = logging.getLogger("fxplc.server")
+
+ScanInterval = 1
+# share of the line a scan cycle may take, the rest is left for writes and REST requests
+LineBudget = 0.8
+StatsWindow = 10
+MinSleep = 0.01
+FeedReconnectDelay = 1
+
+ValueListener = Callable[[List[str]], None]
+
+
+@dataclass
+class VariableState:
+    value: VariableValue | None = None
+    timestamp: float = 0
+    version: int = 0
+    error: bool = False
+    # restored from the warm-start file, not read from the PLC yet
+    stale: bool = False
+
+
+@dataclass
+class ScanClass:
+    interval: float
+    variables: List[VariableDefinition]
+    items: List[BatchItem]
+    wire_time: float
+    next_due: float = 0
+    cycles: int = 0
+    missed_deadlines: int = 0
+    deferred: int = 0
+    last_duration: float = 0
+
+
+@dataclass
+class LineStats:
+    baudrate: int = 9600
+    # (finish time, estimated wire time) of the recent cycles
+    cycles: Deque[Tuple[float, float]] = field(default_factory=deque)
+
+
+# makes ETags from before a restart never match the restarted server's ones
+instance_id = secrets.token_hex(4)
+
+runtime_settings: RuntimeSettings | None = None
+scan_task_handle: asyncio.Task[None] | None = None
+scan_classes: List[ScanClass] = []
+line_stats = LineStats()
+variable_states: Dict[str, VariableState] = {}
+listeners: List[ValueListener] = []
+# value feeds of HTTP workers get every change, but only make the scan run while their worker has listeners
+feed_listeners: List[ValueListener] = []
+remote_watchers = 0
+# get every variable read by a scan cycle, changed or not
+scan_listeners: List[ValueListener] = []
+# set in HTTP worker processes, their values are scanned by the serial owner process and pushed over this connection
+feed_writer: asyncio.StreamWriter | None = None
+feed_task_handle: asyncio.Task[None] | None = None
+stale_refresh_task_handle: asyncio.Task[None] | None = None
+
+
+def send_feed_message(op: str, **kwargs: Any) -> None:
+    if feed_writer is not None:
+        feed_writer.write(encode_message({"op": op, "args": kwargs}))
+
+
+def add_listener(listener: ValueListener) -> None:
+    listeners.append(listener)
+    if len(listeners) == 1:
+        send_feed_message("watch", active=True)
+
+
+def remove_listener(listener: ValueListener) -> None:
+    if listener in listeners:
+        listeners.remove(listener)
+        if len(listeners) == 0:
+            send_feed_message("watch", active=False)
+
+
+def add_scan_listener(listener: ValueListener) -> None:
+    scan_listeners.append(listener)
+
+
+def remove_scan_listener(listener: ValueListener) -> None:
+    if listener in scan_listeners:
+        scan_listeners.remove(listener)
+
+
+def get_state(name: str) -> VariableState:
+    state = variable_states.get(name)
+    if state is None:
+        state = variable_states[name] = VariableState()
+    return state
+
+
+def notify_listeners(names: List[str], to: List[ValueListener] | None = None) -> None:
+    if len(names) == 0:
+        return
+    for listener in to if to is not None else listeners + feed_listeners:
+        try:
+            listener(names)
+        except:
+            logger.exception("value listener failed")
+
+
+def update_state(name: str, value: VariableValue | None, error: bool = False) -> bool:
+    state = get_state(name)
+    if state.stale and error:
+        # the restored value is kept until the PLC answers
+        return False
+    state.timestamp = time.time()
+    if state.value == value and state.error == error and state.version != 0 and not state.stale:
+        return False
+    if not error:
+        state.value = value
+        state.stale = False
+    state.error = error
+    state.version += 1
+    return True
+
+
+def restore_state(name: str, value: VariableValue, timestamp: float) -> None:
+    state = get_state(name)
+    if state.version != 0:
+        return
+    state.value = value
+    state.timestamp = timestamp
+    state.stale = True
+    state.version += 1
+
+
+def publish_value(name: str, value: VariableValue) -> None:
+    if feed_writer is not None:
+        # in a worker only the value is set, the version comes with the owner's push to all workers
+        state = get_state(name)
+        state.value, state.timestamp, state.error, state.stale = value, time.time(), False, False
+        send_feed_message("publish", name=name, value=value)
+        return
+    if update_state(name, value):
+        notify_listeners([name])
+
+
+async def stale_refresh_task(variables: List[VariableDefinition]) -> None:
+    try:
+        values = await read_variables(variables)
+    except Exception as e:
+        logger.debug(f"refresh of {len(variables)} restored values failed ({type(e).__name__})")
+        return
+    for var_def, val in zip(variables, values):
+        publish_value(var_def.name, val)
+
+
+def refresh_stale(variables: List[VariableDefinition]) -> None:
+    global stale_refresh_task_handle
+
+    # restored values are served right away, a single read in the background replaces them for all requests
+    if stale_refresh_task_handle is not None and not stale_refresh_task_handle.done():
+        return
+    stale_refresh_task_handle = asyncio.create_task(stale_refresh_task(variables))
+
+
+def encode_states(names: Iterable[str]) -> Dict[str, List[Any]]:
+    return {name: [state.value, state.timestamp, state.error, state.stale, state.version]
+            for name, state in ((x, get_state(x)) for x in names) if state.version != 0}
+
+
+def apply_states(owner_instance_id: str, states: Dict[str, List[Any]]) -> None:
+    global instance_id
+
+    # workers mirror the owner's states and versions, so ETags match whichever worker serves the request
+    instance_id = owner_instance_id
+    changed = []
+    for name, (value, timestamp, error, stale, version) in states.items():
+        state = get_state(name)
+        if state.version != version:
+            changed.append(name)
+        state.value, state.timestamp, state.error, state.stale, state.version = value, timestamp, error, stale, version
+    notify_listeners(changed)
+
+
+def make_etag(names: Iterable[str]) -> str:
+    versions = ",".join(f"{name}:{get_state(name).version}" for name in names)
+    return f'"{instance_id}-{zlib.crc32(versions.encode("utf-8")):08x}"'
+
+
+async def wait_for_change(names: Iterable[str], timeout: float) -> bool:
+    watched = set(names)
+    event = asyncio.Event()
+
+    def listener(changed: List[str]) -> None:
+        if not watched.isdisjoint(changed):
+            event.set()
+
+    add_listener(listener)
+    try:
+        await asyncio.wait_for(event.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        remove_listener(listener)
+
+
+def build_scan_classes(variables: List[VariableDefinition], baudrate: int) -> List[ScanClass]:
+    by_interval: Dict[float, List[VariableDefinition]] = {}
+    for var_def in variables:
+        by_interval.setdefault(var_def.scan_class, []).append(var_def)
+
+    classes = []
+    for interval, class_variables in sorted(by_interval.items()):
+        items = [BatchItem.parse(register, number_type, name=x.name)
+                 for x in class_variables for register, number_type in variable_reads(x)]
+        classes.append(ScanClass(interval=interval, variables=class_variables, items=items,
+                                 wire_time=spans_wire_time(plan_spans(items), baudrate)))
+    return classes
+
+
+async def scan_variables(variables: List[VariableDefinition]) -> None:
+    changed = []
+    scanned = []
+    try:
+        values = await read_variables(variables)
+        for var_def, val in zip(variables, values):
+            if update_state(var_def.name, val):
+                changed.append(var_def.name)
+        scanned = [x.name for x in variables]
+    except Exception as e:
+        logger.debug(f"scan of {len(variables)} variables failed ({type(e).__name__})")
+        for var_def in variables:
+            if update_state(var_def.name, None, error=True):
+                changed.append(var_def.name)
+    notify_listeners(changed)
+    notify_listeners(scanned, scan_listeners)
+
+
+async def scan_cycle() -> None:
+    now = time.monotonic()
+    due = [x for x in scan_classes if x.next_due <= now]
+    if len(due) == 0:
+        return
+
+    # the fastest class due sets the budget, slower ones are packed into the same frames while they fit
+    budget = due[0].interval * LineBudget
+    selected: List[ScanClass] = []
+    items: List[BatchItem] = []
+    wire_time = 0.0
+    for scan_class in due:
+        candidate_items = items + scan_class.items
+        candidate_wire_time = spans_wire_time(plan_spans(candidate_items), line_stats.baudrate)
+        # a class that would miss its deadline by waiting any longer is read even over the budget
+        if len(selected) > 0 and candidate_wire_time > budget and now < scan_class.next_due + scan_class.interval:
+            scan_class.deferred += 1
+            continue
+        selected.append(scan_class)
+        items, wire_time = candidate_items, candidate_wire_time
+
+    await scan_variables([var_def for scan_class in selected for var_def in scan_class.variables])
+
+    finished = time.monotonic()
+    line_stats.cycles.append((finished, wire_time))
+    while line_stats.cycles[0][0] < finished - StatsWindow:
+        line_stats.cycles.popleft()
+
+    for scan_class in selected:
+        scan_class.cycles += 1
+        scan_class.last_duration = finished - now
+        if finished > scan_class.next_due + scan_class.interval:
+            scan_class.missed_deadlines += 1
+        # an overrun cycle isn't caught up with a burst of reads
+        scan_class.next_due = max(scan_class.next_due + scan_class.interval, finished)
+
+
+async def get_scan_stats() -> Dict[str, Any]:
+    if processor.ipc_client is not None:
+        return cast(Dict[str, Any], await processor.ipc_client.call("scan_stats"))
+
+    now = time.monotonic()
+    recent_wire_time = sum(wire_time for finished, wire_time in line_stats.cycles if finished >= now - StatsWindow)
+    return {
+        "baudrate": line_stats.baudrate,
+        "line_utilisation": recent_wire_time / StatsWindow,
+        "planned_utilisation": sum(x.wire_time / x.interval for x in scan_classes),
+        "classes": [
+            {
+                "interval": x.interval,
+                "variables": len(x.variables),
+                "frames": len(plan_spans(x.items)),
+                "wire_time": x.wire_time,
+                "cycles": x.cycles,
+                "missed_deadlines": x.missed_deadlines,
+                "deferred": x.deferred,
+                "last_duration": x.last_duration,
+            } for x in scan_classes
+        ],
+    }
+
+
+async def scan_task() -> None:
+    logger.info("scan task started")
+    while True:
+        try:
+            # scanning is driven by subscribers, so the line load doesn't depend on how many of them there are
+            if (len(listeners) > 0 or remote_watchers > 0) and is_running():
+                await scan_cycle()
+                next_due = min((x.next_due for x in scan_classes), default=time.monotonic() + ScanInterval)
+                await asyncio.sleep(max(next_due - time.monotonic(), MinSleep))
+            else:
+                await asyncio.sleep(min((x.interval for x in scan_classes), default=ScanInterval))
+        except asyncio.exceptions.CancelledError:
+            logger.info("scan task stopped")
+            return
+        except:
+            logger.exception("scan error")
+            await asyncio.sleep(ScanInterval)
+
+
+def run_scan_task(runtime_settings_: RuntimeSettings, baudrate: int = 9600) -> None:
+    global runtime_settings, scan_task_handle, scan_classes
+    runtime_settings = runtime_settings_
+    line_stats.baudrate = baudrate
+    scan_classes = build_scan_classes(runtime_settings.variables, baudrate)
+    for scan_class in scan_classes:
+        scan_class.next_due = time.monotonic()
+
+    planned_utilisation = sum(x.wire_time / x.interval for x in scan_classes)
+    if planned_utilisation > LineBudget:
+        logger.warning(f"scan classes need {planned_utilisation:.0%} of the line at {baudrate} baud, "
+                       f"deadlines will be missed")
+
+    if scan_task_handle is None:
+        scan_task_handle = asyncio.create_task(scan_task())
+
+
+async def value_feed_task(path: str) -> None:
+    global feed_writer
+
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+            feed_writer = writer
+            send_feed_message("watch", active=len(listeners) > 0)
+            while True:
+                line = await reader.readline()
+                if len(line) == 0:
+                    break
+                message = json.loads(line)
+                apply_states(message["instance"], message["states"])
+            logger.warning("value feed from the serial owner process lost")
+        except asyncio.exceptions.CancelledError:
+            return
+        except OSError:
+            pass
+        finally:
+            feed_writer = None
+        await asyncio.sleep(FeedReconnectDelay)
+
+
+def run_value_feed(path: str) -> None:
+    global feed_task_handle
+
+    if feed_task_handle is None:
+        feed_task_handle = asyncio.create_task(value_feed_task(path))
@@ -1,59 +1,93 @@
 import asyncio
 import json
+import logging
+import multiprocessing
 import os.path
-from typing import Any, Optional, cast
+import tempfile
+import time
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional, cast
 
 import uvicorn
-from fastapi import HTTPException, Body
-from nicegui import app
-from nicegui import ui
-from starlette.responses import Response
+from fastapi import APIRouter, FastAPI, HTTPException, Body, Request, Depends, Query
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
 
+from fxplc.client.models import PlcModel, get_plc_model
 from fxplc.client.number_type import NumberType
+from fxplc.http_server import scanner
+from fxplc.http_server.alarms import get_conditions, get_events, run_alarm_engine
 from fxplc.http_server.aux_server import run_aux_server
-from fxplc.http_server.frontend_ui import register_ui
-from fxplc.http_server.processor import perform_register_read, perform_register_write, resume_serial, \
-    pause_serial, run_serial_task, perform_register_write_bit, perform_register_read_bit
+from fxplc.http_server.encoding import MediaTypeJson, CompressionMiddleware, encode_content, \
+    negotiate_response_format, response_format
+from fxplc.http_server import processor
+from fxplc.http_server.ipc import IpcClient
+from fxplc.http_server.ipc_server import run_ipc_server
+from fxplc.http_server.modbus_server import run_modbus_server
+from fxplc.http_server.processor import perform_register_read, perform_register_write, perform_set_running, \
+    run_serial_task, perform_register_write_bit, perform_register_toggle_bit, perform_register_add, \
+    perform_word_mask, perform_compare_and_set
+from fxplc.http_server.historian import get_history, run_historian
+from fxplc.http_server.warm_start import run_value_store
+from fxplc.http_server.scanner import run_scan_task, run_value_feed
 from fxplc.http_server.mytypes import VariableDefinition, VariablesFile, RuntimeSettings
+from fxplc.http_server.variables import read_variables, split_register, write_variable, toggle_variable, \
+    increment_variable, compare_and_set_variable
 from fxplc.http_server.transport import TransportConfig
 from fxplc.http_server.utils import read_yaml_file
 
+MaxLongPollWait = 60
+# SSE comment sent when there are no events, keeps proxies from closing the stream
+EventStreamHeartbeat = 15
+# responses smaller than this aren't worth compressing
+GzipMinimumSize = 1024
+EventStreamPath = "/events/stream"
 
-class PrettyJSONResponse(Response):
-    media_type = "application/json"
+router = APIRouter(dependencies=[Depends(negotiate_response_format)])
+runtime_settings: RuntimeSettings | None = None
+
+
+class ApiResponse(Response):
+    media_type = MediaTypeJson
+
+    def __init__(self, content: Any = None, status_code: int = 200, headers: Optional[Mapping[str, str]] = None,
+                 media_type: Optional[str] = None, background: Optional[BackgroundTask] = None) -> None:
+        # the format is picked by the negotiate_response_format dependency of the request
+        self._format = response_format.get()
+        super().__init__(content, status_code, headers, media_type or self._format.media_type, background)
+        self.headers["Vary"] = "Accept"
 
     def render(self, content: Any) -> bytes:
-        return json.dumps(content, indent=2, sort_keys=True).encode("utf-8")
+        return encode_content(content, self._format)
 
 
 def get_runtime_settings() -> RuntimeSettings:
-    return cast(RuntimeSettings, app.state.runtime_settings)
+    return cast(RuntimeSettings, runtime_settings)
 
 
-@app.put("/pause", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/pause", response_class=ApiResponse)  # type: ignore
 async def pause_put():
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
 
-    pause_serial()
+    await perform_set_running(False)
     return "OK"
 
 
-@app.put("/resume", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/resume", response_class=ApiResponse)  # type: ignore
 async def resume_put():
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
 
-    resume_serial()
+    await perform_set_running(True)
     return "OK"
 
 
-@app.get("/raw/{register}", response_class=PrettyJSONResponse)  # type: ignore
+@router.get("/raw/{register}", response_class=ApiResponse)  # type: ignore
 async def raw_get(register: str) -> Any:
     return await perform_register_read(register, NumberType.WordSigned)
 
 
-@app.put("/raw/{register}", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/raw/{register}", response_class=ApiResponse)  # type: ignore
 async def raw_put(register: str,
                   value: Optional[int | bool] = None,
                   value_body: Optional[int | bool] = Body(default=None)) -> Any:
@@ -70,7 +104,7 @@ async def raw_put(register: str,
     return await perform_register_write(register, value_to_set, NumberType.WordSigned)
 
 
-@app.put("/raw/{register}/enable", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/raw/{register}/enable", response_class=ApiResponse)  # type: ignore
 async def raw_enable_put(register: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
@@ -78,7 +112,7 @@ async def raw_enable_put(register: str) -> Any:
     return await perform_register_write_bit(register, True)
 
 
-@app.put("/raw/{register}/disable", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/raw/{register}/disable", response_class=ApiResponse)  # type: ignore
 async def raw_disable_put(register: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
@@ -86,13 +120,50 @@ async def raw_disable_put(register: str) -> Any:
     return await perform_register_write_bit(register, False)
 
 
-@app.put("/raw/{register}/toggle", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/raw/{register}/toggle", response_class=ApiResponse)  # type: ignore
 async def raw_toggle_put(register: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
 
-    val = await perform_register_read_bit(register)
-    return await perform_register_write_bit(register, not val)
+    return await perform_register_toggle_bit(register)
+
+
+@router.put("/raw/{register}/increment", response_class=ApiResponse)  # type: ignore
+async def raw_increment_put(register: str, by: int = 1) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    return await perform_register_add(register, by, NumberType.WordSigned)
+
+
+@router.put("/raw/{register}/decrement", response_class=ApiResponse)  # type: ignore
+async def raw_decrement_put(register: str, by: int = 1) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    return await perform_register_add(register, -by, NumberType.WordSigned)
+
+
+@router.put("/raw/{register}/mask", response_class=ApiResponse)  # type: ignore
+async def raw_mask_put(register: str, set_mask: int = Query(default=0, alias="set"),
+                       clear_mask: int = Query(default=0, alias="clear"),
+                       toggle_mask: int = Query(default=0, alias="toggle")) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    return await perform_word_mask(register, set_mask, clear_mask, toggle_mask)
+
+
+@router.put("/raw/{register}/compare_and_set", response_class=ApiResponse)  # type: ignore
+async def raw_compare_and_set_put(register: str, expected: int, value: int) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    swapped, current = await perform_compare_and_set(register, expected, value, NumberType.WordSigned)
+    return {
+        "swapped": swapped,
+        "value": current,
+    }
 
 
 def find_variable_def(name: str) -> VariableDefinition:
@@ -103,45 +174,128 @@ def find_variable_def(name: str) -> VariableDefinition:
     return var_def
 
 
-@app.get("/variable", response_class=PrettyJSONResponse)  # type: ignore
-async def variables_get() -> Any:
-    resp = []
-    for var_def in get_runtime_settings().variables:
-        val = await perform_register_read(var_def.register, var_def.number_type)
-        resp.append({
-            "name": var_def.name,
-            "register": var_def.register,
-            "value": val,
-        })
-    return resp
-
-
-@app.get("/variable/{name}", response_class=PrettyJSONResponse)  # type: ignore
-async def variables_name_get(name: str) -> Any:
-    var_def = find_variable_def(name)
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    return any(x.strip() in (etag, f"W/{etag}", "*") for x in if_none_match.split(","))
 
-    val = await perform_register_read(var_def.register, var_def.number_type)
 
-    return {
+async def wait_for_change(request: Request, names: List[str], etag: str, wait: Optional[float]) -> str:
+    # long-polling is only done when the client already has the current data
+    if wait is None or wait <= 0:
+        return etag
+    if request.headers.get("if-none-match") is not None and not etag_matches(request, etag):
+        return etag
+
+    await scanner.wait_for_change(names, min(wait, MaxLongPollWait))
+    return scanner.make_etag(names)
+
+
+def conditional_response(request: Request, etag: str, content: Any) -> Response:
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return ApiResponse(content, headers={"ETag": etag})
+
+
+def needs_refresh(var_def: VariableDefinition, max_age: Optional[float]) -> bool:
+    # with max_age the scanned value is used when recent enough, and a restored one until the PLC answers
+    if max_age is None:
+        return True
+    state = scanner.get_state(var_def.name)
+    return not (state.stale or (state.version != 0 and not state.error and time.time() - state.timestamp <= max_age))
+
+
+async def refresh_variables(var_defs: List[VariableDefinition], max_age: Optional[float]) -> Dict[str, str]:
+    stale = [x for x in var_defs if max_age is not None and scanner.get_state(x.name).stale]
+    if len(stale) > 0:
+        scanner.refresh_stale(stale)
+
+    var_defs = [x for x in var_defs if needs_refresh(x, max_age)]
+    if len(var_defs) == 0:
+        return {}
+
+    try:
+        values = await read_variables(var_defs)
+    except HTTPException as e:
+        # the restored values are still served, the variables that couldn't be read are reported as errors
+        if len(stale) > 0:
+            return {x.name: str(e.detail) for x in var_defs}
+        raise
+    for var_def, val in zip(var_defs, values):
+        scanner.publish_value(var_def.name, val)
+    return {}
+
+
+def describe_variable(var_def: VariableDefinition) -> Dict[str, Any]:
+    desc: Dict[str, Any] = {
         "name": var_def.name,
         "register": var_def.register,
-        "value": val,
     }
+    if var_def.units is not None:
+        desc["units"] = var_def.units
+    return desc
 
 
-@app.get("/variable/{name}/value", response_class=PrettyJSONResponse)  # type: ignore
+async def write_variable_bit(var_def: VariableDefinition, value: bool) -> Any:
+    if split_register(var_def.register)[1] is not None:
+        return await write_variable(var_def, value)
+    return await perform_register_write_bit(var_def.register, value)
+
+
+@router.get("/variable", response_class=ApiResponse)  # type: ignore
+async def variables_get(request: Request, wait: Optional[float] = None, max_age: Optional[float] = None) -> Any:
+    var_defs = get_runtime_settings().variables
+    errors = await refresh_variables(var_defs, max_age)
+
+    names = [x.name for x in var_defs]
+    etag = await wait_for_change(request, names, scanner.make_etag(names), wait)
+
+    resp = []
+    for var_def in var_defs:
+        state = scanner.get_state(var_def.name)
+        entry = {
+            **describe_variable(var_def),
+            "value": state.value,
+            "stale": state.stale,
+        }
+        if var_def.name in errors:
+            entry["value"] = None
+            entry["error"] = errors[var_def.name]
+        resp.append(entry)
+    return conditional_response(request, etag, resp)
+
+
+@router.get("/variable/{name}", response_class=ApiResponse)  # type: ignore
+async def variables_name_get(name: str, request: Request, wait: Optional[float] = None,
+                             max_age: Optional[float] = None) -> Any:
+    var_def = find_variable_def(name)
+
+    await refresh_variables([var_def], max_age)
+
+    etag = await wait_for_change(request, [var_def.name], scanner.make_etag([var_def.name]), wait)
+
+    state = scanner.get_state(var_def.name)
+    return conditional_response(request, etag, {
+        **describe_variable(var_def),
+        "value": state.value,
+        "stale": state.stale,
+    })
+
+
+@router.get("/variable/{name}/value", response_class=ApiResponse)  # type: ignore
 async def variables_name_get_value(name: str) -> Any:
     var_def = find_variable_def(name)
 
-    val = await perform_register_read(var_def.register, var_def.number_type)
+    val = (await read_variables([var_def]))[0]
 
     return val
 
 
-@app.put("/variable/{name}", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/variable/{name}", response_class=ApiResponse)  # type: ignore
 async def variables_name_put(name: str,
-                             value: Optional[int | bool] = None,
-                             value_body: Optional[int | bool] = Body(default=None)) -> Any:
+                             value: Optional[int | float | bool] = None,
+                             value_body: Optional[int | float | bool] = Body(default=None)) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
 
@@ -156,16 +310,16 @@ async def variables_name_put(name: str,
         value_to_set = value_body
     else:
         raise HTTPException(status_code=400, detail="no value")
-    value_set = await perform_register_write(var_def.register, value_to_set, var_def.number_type)
+    value_set = await write_variable(var_def, value_to_set)
+    scanner.publish_value(var_def.name, value_set)
 
     return {
-        "name": var_def.name,
-        "register": var_def.register,
+        **describe_variable(var_def),
         "value": value_set,
     }
 
 
-@app.put("/variable/{name}/enable", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/variable/{name}/enable", response_class=ApiResponse)  # type: ignore
 async def variables_name_enable_put(name: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
@@ -175,16 +329,16 @@ async def variables_name_enable_put(name: str) -> Any:
     if var_def.readonly:
         raise HTTPException(status_code=403, detail="Readonly variable")
 
-    value_set = await perform_register_write_bit(var_def.register, True)
+    value_set = await write_variable_bit(var_def, True)
+    scanner.publish_value(var_def.name, value_set)
 
     return {
-        "name": var_def.name,
-        "register": var_def.register,
+        **describe_variable(var_def),
         "value": value_set,
     }
 
 
-@app.put("/variable/{name}/disable", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/variable/{name}/disable", response_class=ApiResponse)  # type: ignore
 async def variables_name_disable_put(name: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
@@ -194,16 +348,16 @@ async def variables_name_disable_put(name: str) -> Any:
     if var_def.readonly:
         raise HTTPException(status_code=403, detail="Readonly variable")
 
-    value_set = await perform_register_write_bit(var_def.register, False)
+    value_set = await write_variable_bit(var_def, False)
+    scanner.publish_value(var_def.name, value_set)
 
     return {
-        "name": var_def.name,
-        "register": var_def.register,
+        **describe_variable(var_def),
         "value": value_set,
     }
 
 
-@app.put("/variable/{name}/toggle", response_class=PrettyJSONResponse)  # type: ignore
+@router.put("/variable/{name}/toggle", response_class=ApiResponse)  # type: ignore
 async def variables_name_toggle_put(name: str) -> Any:
     if not get_runtime_settings().rest_enabled:
         raise HTTPException(status_code=400, detail="REST disabled")
@@ -213,47 +367,270 @@ async def variables_name_toggle_put(name: str) -> Any:
     if var_def.readonly:
         raise HTTPException(status_code=403, detail="Readonly variable")
 
-    val = await perform_register_read_bit(var_def.register)
-    value_set = await perform_register_write_bit(var_def.register, not val)
+    value_set = await toggle_variable(var_def)
+    scanner.publish_value(var_def.name, value_set)
+
+    return {
+        **describe_variable(var_def),
+        "value": value_set,
+    }
+
+
+@router.put("/variable/{name}/increment", response_class=ApiResponse)  # type: ignore
+async def variables_name_increment_put(name: str, by: float = 1) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    var_def = find_variable_def(name)
+
+    if var_def.readonly:
+        raise HTTPException(status_code=403, detail="Readonly variable")
+
+    value_set = await increment_variable(var_def, by)
+    scanner.publish_value(var_def.name, value_set)
+
+    return {
+        **describe_variable(var_def),
+        "value": value_set,
+    }
+
+
+@router.put("/variable/{name}/decrement", response_class=ApiResponse)  # type: ignore
+async def variables_name_decrement_put(name: str, by: float = 1) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    var_def = find_variable_def(name)
+
+    if var_def.readonly:
+        raise HTTPException(status_code=403, detail="Readonly variable")
+
+    value_set = await increment_variable(var_def, -by)
+    scanner.publish_value(var_def.name, value_set)
+
+    return {
+        **describe_variable(var_def),
+        "value": value_set,
+    }
+
+
+@router.put("/variable/{name}/compare_and_set", response_class=ApiResponse)  # type: ignore
+async def variables_name_compare_and_set_put(name: str, expected: float, value: float) -> Any:
+    if not get_runtime_settings().rest_enabled:
+        raise HTTPException(status_code=400, detail="REST disabled")
+
+    var_def = find_variable_def(name)
+
+    if var_def.readonly:
+        raise HTTPException(status_code=403, detail="Readonly variable")
+
+    swapped, current = await compare_and_set_variable(var_def, expected, value)
+    scanner.publish_value(var_def.name, current)
+
+    return {
+        **describe_variable(var_def),
+        "value": current,
+        "swapped": swapped,
+    }
+
+
+@router.get("/history/{name}", response_class=ApiResponse)  # type: ignore
+async def history_name_get(name: str,
+                           start: Optional[float] = None,
+                           end: Optional[float] = None,
+                           buckets: Optional[int] = None) -> Any:
+    var_def = find_variable_def(name)
+
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - 3600
 
     return {
         "name": var_def.name,
         "register": var_def.register,
-        "value": value_set,
+        "samples": await get_history(var_def.name, start, end, buckets),
     }
 
 
-def run_server(args: Any) -> None:
-    runtime_settings = RuntimeSettings()
+@router.get("/events", response_class=ApiResponse)  # type: ignore
+async def events_get(since: int = 0, limit: int = 100, wait: Optional[float] = None) -> Any:
+    return await get_events(since, limit, min(wait or 0, MaxLongPollWait))
+
+
+@router.get(EventStreamPath)  # type: ignore
+async def events_stream_get(request: Request, since: Optional[int] = None) -> Any:
+    # fails before the stream starts when there are no conditions
+    await get_conditions()
+
+    last_event_id = request.headers.get("last-event-id")
+    if since is None:
+        since = int(last_event_id) if last_event_id is not None and last_event_id.isdigit() else 0
+
+    async def stream(since_: int) -> AsyncIterator[bytes]:
+        while not await request.is_disconnected():
+            events = await get_events(since_, 100, EventStreamHeartbeat)
+            if len(events) == 0:
+                yield b": heartbeat\n\n"
+            for event in events:
+                since_ = event["id"]
+                yield f"id: {event['id']}\nevent: {event['state']}\ndata: {json.dumps(event)}\n\n".encode("utf-8")
 
-    variables_path = args.variables
+    return StreamingResponse(stream(since), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/conditions", response_class=ApiResponse)  # type: ignore
+async def conditions_get() -> Any:
+    return await get_conditions()
+
+
+@router.get("/scan/stats", response_class=ApiResponse)  # type: ignore
+async def scan_stats_get() -> Any:
+    return await scanner.get_scan_stats()
+
+
+def add_compression(app: FastAPI) -> None:
+    # the event stream is sent uncompressed, gzip would hold back its events
+    app.add_middleware(CompressionMiddleware, minimum_size=GzipMinimumSize, uncompressed_paths=(EventStreamPath,))
+
+
+def get_model(args: Any) -> PlcModel | None:
+    return get_plc_model(args.model) if args.model is not None else None
+
+
+def load_runtime_settings(variables_path: str | None) -> RuntimeSettings:
+    settings = RuntimeSettings()
 
     if variables_path is not None:
         if not os.path.exists(variables_path):
             print("file specified by --variables option doesn't exist")
             exit(1)
 
-        variables_data = read_yaml_file(variables_path)
-        runtime_settings.variables = VariablesFile(**variables_data).variables
+        variables_file = VariablesFile(**read_yaml_file(variables_path))
+        settings.variables = variables_file.variables
+        settings.modbus = variables_file.modbus
+        settings.conditions = variables_file.conditions
+
+    return settings
+
+
+async def run_serial_owner(args: Any, settings: RuntimeSettings, ipc_path: str) -> None:
+    if args.state_file is not None:
+        run_value_store(settings, args.state_file)
+    run_serial_task(TransportConfig(path=args.path, baudrate=args.baudrate), get_model(args))
+    run_scan_task(settings, args.baudrate)
+    if args.historian is not None:
+        run_historian(settings, args.historian)
+    run_alarm_engine(settings, args.event_webhook, args.event_socket)
+    servers = [run_aux_server(), run_ipc_server(ipc_path)]
+    if args.modbus_port is not None:
+        servers.append(run_modbus_server(settings.modbus, args.modbus_port))
+    await asyncio.gather(*servers)
+
+
+def serial_owner_main(args: Any, ipc_path: str) -> None:
+    global runtime_settings
+    runtime_settings = load_runtime_settings(args.variables)
+
+    logging.info("serial owner process started")
+    try:
+        asyncio.run(run_serial_owner(args, runtime_settings, ipc_path))
+    except KeyboardInterrupt:
+        pass
+
+
+def create_worker_app() -> FastAPI:
+    global runtime_settings
+    runtime_settings = load_runtime_settings(os.environ.get("FXPLC_VARIABLES"))
 
-    app.state.runtime_settings = runtime_settings
+    ipc_path = os.environ["FXPLC_IPC_SOCKET"]
+    processor.ipc_client = IpcClient(ipc_path)
+
+    app = FastAPI(title="FXPLC server")
+    app.include_router(router)
+    add_compression(app)
+
+    def on_startup() -> None:
+        # the serial owner scans, restores and records the values, workers get them pushed
+        run_value_feed(ipc_path)
+
+    app.add_event_handler("startup", on_startup)
+    return app
+
+
+def run_multiprocess_server(args: Any) -> None:
+    # HTTP workers forward register requests to the single process owning the transport
+    ipc_path = os.path.join(tempfile.gettempdir(), f"fxplc-{os.getpid()}.sock")
+    owner = multiprocessing.Process(target=serial_owner_main, args=(args, ipc_path), daemon=True)
+    owner.start()
+
+    os.environ["FXPLC_IPC_SOCKET"] = ipc_path
+    if args.variables is not None:
+        os.environ["FXPLC_VARIABLES"] = os.path.abspath(args.variables)
+
+    try:
+        uvicorn.run("fxplc.http_server.server:create_worker_app", factory=True, workers=args.workers,
+                    host="0.0.0.0", port=args.port, reload=False, access_log=False)
+    finally:
+        owner.terminate()
+        owner.join()
+        if os.path.exists(ipc_path):
+            os.unlink(ipc_path)
+
+
+def run_server(args: Any) -> None:
+    global runtime_settings
+
+    if args.workers > 1:
+        if not args.no_ui:
+            print("--workers requires --no-ui")
+            exit(1)
+        run_multiprocess_server(args)
+        return
+
+    settings = runtime_settings = load_runtime_settings(args.variables)
 
     started = False
 
-    transport_config = TransportConfig(path=args.path)
+    transport_config = TransportConfig(path=args.path, baudrate=args.baudrate)
+
+    app: FastAPI
+    if args.no_ui:
+        app = FastAPI(title="FXPLC server")
+    else:
+        # NiceGUI is only imported when the UI is enabled, it dominates startup time and memory usage
+        from nicegui import app as nicegui_app
+        app = nicegui_app
+
+    app.include_router(router)
+    add_compression(app)
 
     def on_startup() -> None:
         nonlocal started
         if started:
             return
         started = True
-        run_serial_task(transport_config)
-        app.state.aux_server_task = asyncio.create_task(run_aux_server(transport_config))
+        if args.state_file is not None:
+            run_value_store(settings, args.state_file)
+        run_serial_task(transport_config, get_model(args))
+        run_scan_task(settings, args.baudrate)
+        if args.historian is not None:
+            run_historian(settings, args.historian)
+        run_alarm_engine(settings, args.event_webhook, args.event_socket)
+        app.state.aux_server_task = asyncio.create_task(run_aux_server())
+        if args.modbus_port is not None:
+            app.state.modbus_server_task = asyncio.create_task(run_modbus_server(settings.modbus, args.modbus_port))
+
+    if args.no_ui:
+        app.add_event_handler("startup", on_startup)
+    else:
+        from nicegui import ui
+        from fxplc.http_server.frontend_ui import register_ui
 
-    app.on_startup(on_startup)
+        nicegui_app.on_startup(on_startup)
 
-    register_ui(runtime_settings)
+        register_ui(settings)
 
-    ui.run_with(app, mount_path=args.base_href, title="FXPLC server")
+        ui.run_with(app, mount_path=args.base_href, title="FXPLC server")
 
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=False, access_log=False)
+    uvicorn.run(app, host="0.0.0.0", port=args.port, reload=False, access_log=False)
@@ -3,12 +3,14 @@ from dataclasses import dataclass
 
 from fxplc.transports.ITransport import ITransport
 from fxplc.transports.TransportSerial import TransportSerial
+from fxplc.transports.TransportSim import TransportSim
 from fxplc.transports.TransportTCP import TransportTCP
 
 
 @dataclass
 class TransportConfig:
     path: str
+    baudrate: int = 9600
 
 
 async def connect_to_transport(config: TransportConfig) -> ITransport:
@@ -21,7 +23,11 @@ async def connect_to_transport(config: TransportConfig) -> ITransport:
         await tcp_transport.connect()
         logging.info("connection done")
         transport = tcp_transport
+    elif config.path == "sim" or config.path.startswith("sim:"):
+        # sim - instant answers, sim:BAUDRATE - paced like a serial line
+        _, _, baudrate = config.path.partition(":")
+        transport = TransportSim(baudrate=int(baudrate) if baudrate != "" else None)
     else:
-        transport = TransportSerial(config.path)
+        transport = TransportSerial(config.path, baudrate=config.baudrate)
 
     return transport
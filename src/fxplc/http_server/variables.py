@@ -0,0 +1,106 @@
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from fxplc.client.FXPLCClient import RegisterDef
+from fxplc.client.number_type import NumberType
+from fxplc.http_server.mytypes import ScalarValue, VariableDefinition, VariableValue
+from fxplc.http_server.processor import perform_batch_read, perform_register_write, perform_word_bit_write, \
+    perform_register_add, perform_compare_and_set, perform_register_toggle_bit, perform_word_mask
+
+
+def split_register(register: str) -> Tuple[str, Optional[int]]:
+    # D10.3 is bit 3 of D10
+    register_str, _, bit_str = register.partition(".")
+    return register_str, int(bit_str) if bit_str != "" else None
+
+
+def variable_reads(var_def: VariableDefinition) -> List[Tuple[str, NumberType]]:
+    if var_def.fields is None:
+        return [(var_def.register, var_def.number_type)]
+
+    base = RegisterDef.parse(var_def.register)
+    reads = []
+    for x in var_def.fields:
+        register = str(RegisterDef(base.type, base.num + x.word))
+        reads.append((f"{register}.{x.bit}" if x.bit is not None else register, x.number_type))
+    return reads
+
+
+def scale(raw: ScalarValue, gain: float, offset: float) -> ScalarValue:
+    # bits and unscaled numbers keep their type
+    if isinstance(raw, bool) or (gain == 1 and offset == 0):
+        return raw
+    return raw * gain + offset
+
+
+def decode_variable(var_def: VariableDefinition, raw_values: List[ScalarValue]) -> VariableValue:
+    if var_def.fields is None:
+        return scale(raw_values[0], var_def.gain, var_def.offset)
+    return {x.name: scale(raw, x.gain, x.offset) for x, raw in zip(var_def.fields, raw_values)}
+
+
+async def read_variables(var_defs: List[VariableDefinition]) -> List[VariableValue]:
+    # all variables are read in one request, so bits of one word and structure fields share the frames
+    reads = [variable_reads(x) for x in var_defs]
+    raw_values = await perform_batch_read([read for var_reads in reads for read in var_reads])
+
+    values = []
+    pos = 0
+    for var_def, var_reads in zip(var_defs, reads):
+        values.append(decode_variable(var_def, raw_values[pos:pos + len(var_reads)]))
+        pos += len(var_reads)
+    return values
+
+
+def to_raw(var_def: VariableDefinition, value: ScalarValue) -> ScalarValue:
+    if isinstance(value, bool):
+        return value
+    raw = (value - var_def.offset) / var_def.gain
+    # only integer registers are rounded, a float register takes the value as it is
+    return raw if var_def.number_type == NumberType.Float else round(raw)
+
+
+def get_number_register(var_def: VariableDefinition) -> str:
+    register_str, bit = split_register(var_def.register)
+    if var_def.fields is not None or bit is not None:
+        raise HTTPException(status_code=400, detail="not a number variable")
+    return register_str
+
+
+async def write_variable(var_def: VariableDefinition, value: ScalarValue) -> VariableValue:
+    if var_def.fields is not None:
+        raise HTTPException(status_code=400, detail="structure variables can't be written as a whole")
+
+    register_str, bit = split_register(var_def.register)
+    if bit is not None:
+        return await perform_word_bit_write(register_str, bit, bool(value))
+
+    raw = to_raw(var_def, value)
+    return scale(await perform_register_write(register_str, raw, var_def.number_type), var_def.gain, var_def.offset)
+
+
+async def toggle_variable(var_def: VariableDefinition) -> bool:
+    if var_def.fields is not None:
+        raise HTTPException(status_code=400, detail="structure variables can't be toggled")
+
+    register_str, bit = split_register(var_def.register)
+    if bit is not None:
+        return (await perform_word_mask(register_str, toggle_mask=1 << bit) & (1 << bit)) != 0
+    return await perform_register_toggle_bit(register_str)
+
+
+async def increment_variable(var_def: VariableDefinition, amount: float) -> VariableValue:
+    # the amount is in scaled units, the offset doesn't apply to a difference
+    delta = amount / var_def.gain
+    if var_def.number_type != NumberType.Float:
+        delta = round(delta)
+    new = await perform_register_add(get_number_register(var_def), delta, var_def.number_type)
+    return scale(new, var_def.gain, var_def.offset)
+
+
+async def compare_and_set_variable(var_def: VariableDefinition, expected: ScalarValue,
+                                   value: ScalarValue) -> Tuple[bool, VariableValue]:
+    swapped, current = await perform_compare_and_set(get_number_register(var_def), to_raw(var_def, expected),
+                                                     to_raw(var_def, value), var_def.number_type)
+    return swapped, scale(current, var_def.gain, var_def.offset)
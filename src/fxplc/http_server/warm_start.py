@@ -0,0 +1,145 @@
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from fxplc.http_server import scanner
+from fxplc.http_server.mytypes import RuntimeSettings
+
+logger = logging.getLogger("fxplc.warm_start")
+
+FlushInterval = 5
+
+# File layout: magic, slot count, then one fixed-size slot per variable, in the order of the variables file.
+#   slot: <u32 crc32 of the name> <u8 kind> <f64 value> <f64 timestamp>
+# Slots are updated in place through mmap, so a changed value costs a memory write, not a syscall.
+StateMagic = b"FXSTATE1"
+HeaderFormat = "<8sI"
+SlotFormat = "<IBdd"
+HeaderSize = struct.calcsize(HeaderFormat)
+SlotSize = struct.calcsize(SlotFormat)
+
+KindEmpty = 0
+KindInt = 1
+KindFloat = 2
+KindBool = 3
+
+
+def encode_kind(value: int | float | bool) -> int:
+    if isinstance(value, bool):
+        return KindBool
+    elif isinstance(value, int):
+        return KindInt
+    else:
+        return KindFloat
+
+
+def decode_value(kind: int, value: float) -> int | float | bool:
+    if kind == KindBool:
+        return value != 0
+    elif kind == KindInt:
+        return int(value)
+    else:
+        return value
+
+
+def name_hash(name: str) -> int:
+    return zlib.crc32(name.encode("utf-8"))
+
+
+class ValueStore:
+    def __init__(self, runtime_settings: RuntimeSettings, path: str) -> None:
+        self._names = [x.name for x in runtime_settings.variables]
+        self._slots: Dict[str, int] = {name: i for i, name in enumerate(self._names)}
+        self._path = path
+        self._mmap: Optional[mmap.mmap] = None
+        self._last_flush = 0.0
+
+    def load(self) -> int:
+        if not os.path.exists(self._path):
+            return 0
+
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        try:
+            magic, count = struct.unpack_from(HeaderFormat, data, 0)
+            if magic != StateMagic:
+                logger.warning(f"{self._path} is not a state file, ignoring it")
+                return 0
+
+            names = {name_hash(x): x for x in self._names}
+            restored = 0
+            for i in range(count):
+                crc, kind, value, timestamp = struct.unpack_from(SlotFormat, data, HeaderSize + i * SlotSize)
+                name = names.get(crc)
+                if name is not None and kind != KindEmpty:
+                    scanner.restore_state(name, decode_value(kind, value), timestamp)
+                    restored += 1
+        except struct.error:
+            logger.warning(f"{self._path} is truncated, ignoring the rest")
+            return 0
+
+        logger.info(f"restored {restored} values from {self._path}")
+        return restored
+
+    def open(self) -> None:
+        self.load()
+
+        # the file is rewritten, so it matches the current variables even if they changed since the last run
+        size = HeaderSize + SlotSize * len(self._names)
+        with open(self._path, "wb") as f:
+            f.write(struct.pack(HeaderFormat, StateMagic, len(self._names)))
+            for name in self._names:
+                f.write(self._encode_slot(name))
+            f.flush()
+
+        if len(self._names) == 0:
+            return
+
+        with open(self._path, "r+b") as f:
+            self._mmap = mmap.mmap(f.fileno(), size)
+        scanner.add_listener(self.on_values_changed)
+
+    def close(self) -> None:
+        scanner.remove_listener(self.on_values_changed)
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+
+    def _encode_slot(self, name: str) -> bytes:
+        state = scanner.get_state(name)
+        if state.value is None or isinstance(state.value, dict):
+            return struct.pack(SlotFormat, name_hash(name), KindEmpty, 0, 0)
+        return struct.pack(SlotFormat, name_hash(name), encode_kind(state.value), float(state.value), state.timestamp)
+
+    def on_values_changed(self, names: List[str]) -> None:
+        if self._mmap is None:
+            return
+
+        for name in names:
+            slot = self._slots.get(name)
+            if slot is None or scanner.get_state(name).stale:
+                continue
+            offset = HeaderSize + slot * SlotSize
+            self._mmap[offset:offset + SlotSize] = self._encode_slot(name)
+
+        now = time.monotonic()
+        if now - self._last_flush >= FlushInterval:
+            self._mmap.flush()
+            self._last_flush = now
+
+
+value_store: ValueStore | None = None
+
+
+def run_value_store(runtime_settings: RuntimeSettings, path: str) -> None:
+    global value_store
+
+    if value_store is None:
+        value_store = ValueStore(runtime_settings, path)
+        value_store.open()
@@ -0,0 +1,122 @@
+import asyncio
+import binascii
+
+from .ITransport import ITransport
+
+STX = 0x02
+ETX = 0x03
+ENQ = b'\x05'
+ACK = b'\x06'
+NAK = b'\x15'
+
+# FORCE_ON/FORCE_OFF bit address areas -> bit image address, mirrors the FX-232AW address map
+ForceAreas = [
+    (0x0000, 0x03e7, 0x0000),  # S
+    (0x0400, 0x04ff, 0x0080),  # X
+    (0x0500, 0x05ff, 0x00a0),  # Y
+    (0x0600, 0x06ff, 0x00c0),  # T
+    (0x0800, 0x0bff, 0x0100),  # M
+    (0x0f00, 0x0fff, 0x01e0),  # M8000-M8255
+]
+
+DefaultReadTimeout = 1
+
+
+def calc_checksum(payload: bytes) -> bytes:
+    return f"{sum(payload):02X}"[-2:].encode("ascii")
+
+
+# In-process PLC simulator, for tests and benchmarks without hardware. With a baudrate, writes and reads take
+# as long as the characters would on a 7E1 serial line, otherwise the PLC answers instantly.
+class TransportSim(ITransport):
+    def __init__(self, baudrate: int | None = None, response_delay: float = 0,
+                 timeout: float = DefaultReadTimeout) -> None:
+        self.memory = bytearray(0x10000)
+        self._baudrate = baudrate
+        self._response_delay = response_delay
+        self._timeout = timeout
+        self._rx = bytearray()
+        self._tx = bytearray()
+        self._rx_event = asyncio.Event()
+
+    def close(self) -> None:
+        pass
+
+    async def write(self, data: bytes) -> None:
+        await self._wire_delay(len(data))
+        self._tx += data
+        response = self._process()
+        if len(response) > 0:
+            if self._response_delay > 0:
+                await asyncio.sleep(self._response_delay)
+            self._rx += response
+            self._rx_event.set()
+
+    async def read(self, size: int) -> bytes:
+        while len(self._rx) < size:
+            self._rx_event.clear()
+            try:
+                await asyncio.wait_for(self._rx_event.wait(), self._timeout)
+            except asyncio.TimeoutError:
+                break
+
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        await self._wire_delay(len(data))
+        return data
+
+    async def _wire_delay(self, size: int) -> None:
+        if self._baudrate is not None and size > 0:
+            await asyncio.sleep(size * 10 / self._baudrate)
+
+    def _process(self) -> bytes:
+        response = b""
+        while len(self._tx) > 0:
+            if self._tx[:1] == ENQ:
+                del self._tx[:1]
+                response += ACK
+                continue
+            if self._tx[0] != STX:
+                del self._tx[:1]
+                continue
+
+            end = self._tx.find(bytes([ETX]))
+            if end < 0 or len(self._tx) < end + 3:
+                break
+            payload = bytes(self._tx[1:end])
+            checksum = bytes(self._tx[end + 1:end + 3])
+            del self._tx[:end + 3]
+
+            if calc_checksum(payload + bytes([ETX])) != checksum:
+                response += NAK
+                continue
+            response += self._execute(payload[0:1], binascii.unhexlify(payload[1:]))
+        return response
+
+    def _execute(self, cmd: bytes, data: bytes) -> bytes:
+        if cmd == b"0":
+            addr, count = int.from_bytes(data[0:2], "big"), data[2]
+            out = binascii.hexlify(self.memory[addr:addr + count]).upper()
+            return bytes([STX]) + out + bytes([ETX]) + calc_checksum(out + bytes([ETX]))
+        elif cmd == b"1":
+            addr, count = int.from_bytes(data[0:2], "big"), data[2]
+            self.memory[addr:addr + count] = data[3:3 + count]
+            return ACK
+        elif cmd in (b"7", b"8"):
+            bit_addr = int.from_bytes(data[0:2], "little")
+            for first, last, image_addr in ForceAreas:
+                if first <= bit_addr <= last:
+                    byte_addr, bit = image_addr + (bit_addr - first) // 8, (bit_addr - first) % 8
+                    if cmd == b"7":
+                        self.memory[byte_addr] |= 1 << bit
+                    else:
+                        self.memory[byte_addr] &= ~(1 << bit)
+                    return ACK
+            return NAK
+        else:
+            return NAK
+
+
+__all__ = [
+    "TransportSim",
+]